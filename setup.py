@@ -36,6 +36,7 @@ setup(
         'SQLAlchemy==0.9.9'      # GeoAlchemy2 support.
     ],
     extras_require={
+        'arrow': ['pyarrow>=0.17'],  # ParquetWriter and Arrow interchange.
         'gdal': ['GDAL>=1.7'],     # Python 3 support.
         'plot': ['pygraphviz'],
         'sim': ['urbansim>=1.3'],  # TableFrame support and sim.table caching.
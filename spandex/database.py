@@ -3,6 +3,7 @@ import logging
 
 from geoalchemy2 import Geometry  # Needed for database reflection. # noqa
 import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
 from sqlalchemy import create_engine
 from sqlalchemy.exc import ArgumentError
 from sqlalchemy.ext.compiler import compiles
@@ -35,6 +36,7 @@ class database(object):
     _connection = None
     _engine = None
     _model = None
+    _connect_args = None
 
     @classmethod
     def connect(cls, *args, **kwargs):
@@ -47,6 +49,7 @@ class database(object):
             cls.close()
 
         cls._connection = psycopg2.connect(*args, **kwargs)
+        cls._connect_args = (args, kwargs)
 
         # Build GeoAlchemy engine.
         cls._engine = create_engine('postgresql://',
@@ -180,6 +183,28 @@ class database(object):
             with conn.cursor() as cur:
                 yield cur
 
+    @classmethod
+    @contextmanager
+    def pool(cls, size):
+        """
+        Create a pool of dedicated connections for concurrent workers.
+
+        Connections are opened on demand with the same arguments as the
+        managed connection, up to size connections, and are all closed
+        when the context exits. The pool is thread-safe; each worker
+        should check a connection out with getconn and return it with
+        putconn.
+
+        """
+        cls.assert_connected()
+
+        args, kwargs = cls._connect_args
+        pool = ThreadedConnectionPool(0, size, *args, **kwargs)
+        try:
+            yield pool
+        finally:
+            pool.closeall()
+
     @classmethod
     @contextmanager
     def session(cls):
@@ -194,11 +219,14 @@ class database(object):
 
 class CreateTableAs(UpdateBase):
     """Represents a ``CREATE TABLE/VIEW AS SELECT`` statement."""
-    def __init__(self, table_name, query, view=False):
+    def __init__(self, table_name, query, view=False, unlogged=False,
+                 temporary=False):
         assert '.' in table_name, "Table name should be schema-qualified."
         self.table_name = table_name
         self.query = query
         self.view = view
+        self.unlogged = unlogged
+        self.temporary = temporary
 
 
 @compiles(CreateTableAs)
@@ -207,6 +235,10 @@ def visit_create_table_as(element, compiler, *args, **kwargs):
         store = "VIEW"
     else:
         store = "TABLE"
+    if element.temporary:
+        store = "TEMPORARY " + store
+    elif element.unlogged and not element.view:
+        store = "UNLOGGED " + store
     return "CREATE {store} {table} AS ({query})".format(
         table=element.table_name,
         store=store,
@@ -1,18 +1,31 @@
+import codecs
+import datetime
+import decimal
+import hashlib
 import json
 import logging
 import os
+import re
+import struct
 import subprocess
+import threading
+import time
+import weakref
 
+import numpy as np
 import pandas as pd
 import psycopg2
-from six import string_types
+from geoalchemy2 import Geometry
+from six import BytesIO, integer_types, string_types
 from six.moves import cStringIO, range, urllib
-from sqlalchemy import func
+from sqlalchemy import and_, case, func, text
 from sqlalchemy.ext.declarative import DeclarativeMeta
 from sqlalchemy.orm import Query
+from sqlalchemy.types import Integer
 
+from . import pgcopy
 from .database import database as db, CreateTableAs
-from .utils import load_config, logf
+from .utils import load_config, logf, parallel_map
 
 
 # Set up logging system.
@@ -67,14 +80,34 @@ class TableLoader(object):
         get_attributes:  Export shapefile attributes as a pandas DataFrame.
         get_encoding:    Identify shapefile attribute encoding.
         get_srid:        Identify shapefile EPSG SRID.
+        get_vector_srid: Identify vector layer EPSG SRID.
+        load_delimited:  Load a delimited text file into a table.
+        load_delimited_map: Load multiple delimited text files into tables.
         load_shp:        Load a shapefile into a PostGIS table.
         load_shp_map:    Load multiple shapefiles into PostGIS tables.
+        load_vector:     Load a vector layer of any OGR format into PostGIS.
+        promote:         Make an UNLOGGED table crash-safe (logged).
 
     Attributes:
         database:        PostgreSQL database connection manager class.
         directory:       Path to the directory containing the shapefiles.
         srid:            Default Spatial Reference System Identifier (SRID).
         tables:          PostgreSQL table objects, namespaced by schema.
+        unlogged:        Whether to create new tables as UNLOGGED by default.
+                         UNLOGGED tables skip the write-ahead log, so they
+                         load much faster but are truncated after a crash.
+        offline:         Whether to identify SRIDs without network access,
+                         never querying the prj2EPSG API.
+        srid_cache:      Path to persistent cache of SRIDs identified from
+                         prj files, or False to disable. Defaults to
+                         ~/.spandex/srid_cache.json.
+        manifest:        Schema-qualified name of the load manifest table,
+                         or None to disable. The manifest records the source
+                         file fingerprint of each loaded table, so that
+                         unchanged files are skipped when reloading.
+        checkpoint:      Schema-qualified name of the table recording the
+                         progress of chunked loads. Defaults to
+                         public.spandex_checkpoint.
 
     Attributes can be passed as additional constructor arguments and override
     configuration.
@@ -87,7 +120,8 @@ class TableLoader(object):
 
     """
     def __init__(self, config_filename=None, database=None, directory=None,
-                 srid=None):
+                 srid=None, unlogged=False, offline=None, srid_cache=None,
+                 manifest=None, checkpoint=None):
         # Attempt to load configuration.
         config = load_config(config_filename)
 
@@ -98,6 +132,23 @@ class TableLoader(object):
             directory = config.get('data', 'directory')
         if not srid:
             srid = config.get('data', 'srid')
+        if offline is None:
+            if config.has_option('data', 'offline'):
+                offline = config.getboolean('data', 'offline')
+            else:
+                offline = False
+        if srid_cache is None:
+            if config.has_option('data', 'srid_cache'):
+                srid_cache = config.get('data', 'srid_cache')
+            else:
+                srid_cache = '~/.spandex/srid_cache.json'
+        if not manifest and config.has_option('data', 'manifest'):
+            manifest = config.get('data', 'manifest')
+        if not checkpoint:
+            if config.has_option('data', 'checkpoint'):
+                checkpoint = config.get('data', 'checkpoint')
+            else:
+                checkpoint = 'public.spandex_checkpoint'
 
         # Create new connection(s) using configuration, unless already
         # connected.
@@ -115,11 +166,37 @@ class TableLoader(object):
         else:
             raise IOError("Directory does not exist: %s" % directory)
         self.srid = int(srid)
-
-    def duplicate(self, table, new_table_name, schema_name='public'):
+        self.unlogged = unlogged
+        self.offline = offline
+        if srid_cache:
+            self.srid_cache = os.path.expanduser(srid_cache)
+        else:
+            self.srid_cache = None
+        self._srid_cache = None
+        self._srid_index = None
+        self._srid_auth = {}
+        self.manifest = manifest
+        self.checkpoint = checkpoint
+
+    def duplicate(self, table, new_table_name, schema_name='public',
+                  workers=1, unlogged=False):
         """
         Duplicate a PostgreSQL table, including indexes and constraints.
 
+        The new table is created without indexes and the data is copied,
+        so that indexes are not maintained row by row. Primary key,
+        unique, and exclusion constraints and other indexes are then
+        rebuilt from the definitions of the source table, and the new
+        table is analyzed.
+
+        With more than one worker, the data is copied concurrently in
+        ranges of physical row locations (ctid) on dedicated connections,
+        which all share the snapshot of one transaction, so the copy is
+        consistent. Before PostgreSQL 14, which cannot scan ctid ranges
+        directly, every range would scan the whole table, so the data is
+        copied with a single INSERT ... SELECT instead. Indexes are also
+        rebuilt concurrently.
+
         Parameters
         ----------
         table : sqlalchemy.ext.declarative.api.DeclarativeMeta
@@ -128,6 +205,12 @@ class TableLoader(object):
             Name of new table.
         schema_name : str, optional
             Name of schema to contain the new table. Default is 'public'.
+        workers : int, optional
+            Number of connections to copy data and build indexes on.
+            Default is 1.
+        unlogged : bool, optional
+            Whether to create the new table as UNLOGGED, like a snapshot
+            that need not survive a crash. Default is False.
 
         Returns
         -------
@@ -135,17 +218,34 @@ class TableLoader(object):
             Duplicated ORM table class.
 
         """
-        # Copy schema including constraints and indexes, then insert values.
-        # This may be inefficient, unfortunately.
         t = table.__table__
+        source = "{}.{}".format(t.schema, t.name)
+        target = "{}.{}".format(schema_name, new_table_name)
+
         with db.cursor() as cur:
             cur.execute("""
-                CREATE TABLE {nschema}.{ntable}
-                    (LIKE {oschema}.{otable} INCLUDING ALL);
-                INSERT INTO {nschema}.{ntable}
-                    SELECT * FROM {oschema}.{otable};
-            """.format(nschema=schema_name, ntable=new_table_name,
-                       oschema=t.schema, otable=t.name))
+                CREATE {unlogged}TABLE {target}
+                    (LIKE {source} INCLUDING ALL EXCLUDING INDEXES);
+            """.format(unlogged='UNLOGGED ' if unlogged else '',
+                       source=source, target=target))
+            statements = _index_statements(cur, source, target)
+            if workers <= 1:
+                cur.execute("INSERT INTO {} SELECT * FROM {};".format(
+                    target, source))
+                for statement in statements:
+                    cur.execute(statement)
+                cur.execute("ANALYZE {};".format(target))
+
+        if workers > 1:
+            try:
+                _parallel_copy(source, target, workers)
+                _parallel_execute(statements, workers)
+                with db.cursor() as cur:
+                    cur.execute("ANALYZE {};".format(target))
+            except Exception:
+                with db.cursor() as cur:
+                    cur.execute("DROP TABLE IF EXISTS {};".format(target))
+                raise
 
         # Refresh ORM and return table class.
         db.refresh()
@@ -173,16 +273,19 @@ class TableLoader(object):
         filepath = os.path.join(self.directory, filename)
         return filepath
 
-    def get_attributes(self, filename):
+    def get_attributes(self, filename, usecols=None):
         """
         Export shapefile attributes as a pandas DataFrame.
 
-        Uses OGR's ESRI Shapefile driver to read records from the file.
+        Attributes are decoded using the encoding identified by
+        get_encoding.
 
         Parameters
         ----------
         filename : str
             Shapefile or dBase/xBase file, relative to the data directory.
+        usecols : list of str, optional
+            Names of columns to read. Defaults to all columns.
 
         Returns
         -------
@@ -193,7 +296,8 @@ class TableLoader(object):
         if splitext[1].lower() == '.shp':
             filename = splitext[0] + '.dbf'
         filepath = self.get_path(filename)
-        return dbf_to_df(filepath)
+        encoding = self.get_encoding(splitext[0] + '.shp')
+        return dbf_to_df(filepath, usecols=usecols, encoding=encoding)
 
     def get_encoding(self, filename):
         """Identify shapefile attribute table encoding.
@@ -231,11 +335,17 @@ class TableLoader(object):
         return encoding
 
     def get_srid(self, filename):
-        """Identify shapefile SRID using GDAL and prj2EPSG API.
+        """Identify shapefile SRID using GDAL and spatial_ref_sys.
 
         Try to identify the SRID of a shapefile by reading the
         projection information of the prj file and matching to an
-        EPSG SRID using GDAL and the prj2EPSG API.
+        EPSG SRID using GDAL, then using a local index of the
+        spatial_ref_sys table, by normalized WKT and PROJ.4 definition.
+        Unless offline, the prj2EPSG API is queried as a last resort.
+
+        Identified EPSG SRIDs are memoized in a persistent on-disk cache
+        keyed by a hash of the prj file content, so each projection only
+        needs to be identified once.
 
         If the prj file cannot be read, warn and return 0,
         which is the default SRID in PostGIS 2.0+.
@@ -260,64 +370,238 @@ class TableLoader(object):
             logger.warn("Unable to open projection information: %s"
                         % filename)
             return 0
+        return self._identify_srid(wkt, filename, esri=True)
+
+    def get_vector_srid(self, filename, layer=None):
+        """Identify SRID of an OGR vector layer.
+
+        Like get_srid, but reads the projection information of any
+        OGR-supported vector format, like GeoPackage, GeoJSON, or
+        FlatGeobuf, instead of a shapefile prj file. Layers with an EPSG
+        authority code return it directly.
+
+        If the layer has no projection information, warn and return 0.
+
+        Args:
+            filename: Vector data source, relative to the data directory.
+            layer:    Layer name or index. Defaults to the first layer.
+
+        Returns:
+            srid: EPSG, custom SRID, or 0.
+
+        """
+        dataset = _open_ogr(self.get_path(filename))
+        ogr_layer = _get_ogr_layer(dataset, layer, filename)
+        sr = ogr_layer.GetSpatialRef()
+        if sr is None:
+            logger.warn("No projection information: %s" % filename)
+            return 0
+        if (sr.GetAuthorityName(None) or '').upper() == 'EPSG':
+            srid = int(sr.GetAuthorityCode(None))
+            logger.debug("Layer reported SRID %s: %s" % (srid, filename))
+            return srid
+        return self._identify_srid(sr.ExportToWkt(), filename)
+
+    def _identify_srid(self, wkt, filename, esri=False):
+        """Identify SRID of WKT projection information.
+
+        See get_srid for the identification steps.
+
+        Args:
+            wkt:      Projection WKT.
+            filename: File the projection is from, for logging.
+            esri:     Whether the WKT is in the ESRI dialect, as in
+                      shapefile prj files. Defaults to False.
+
+        Returns:
+            srid: EPSG or custom SRID.
+
+        """
+        # Look up SRID previously identified from the same projection.
+        prj_hash = hashlib.sha1(wkt.encode('utf-8')).hexdigest()
+        cache = self._load_srid_cache()
+        if prj_hash in cache:
+            srid = cache[prj_hash]
+            logger.debug("Cache returned SRID %s: %s" % (srid, filename))
+            return srid
+
+        srid = None
+        proj4 = None
 
         # Attempt to identify EPSG SRID using GDAL.
         if gdal:
             sr = osr.SpatialReference()
-            sr.ImportFromESRI([wkt])
+            if esri:
+                sr.ImportFromESRI([wkt])
+            else:
+                sr.ImportFromWkt(wkt)
+            proj4 = sr.ExportToProj4().strip()
             res = sr.AutoIdentifyEPSG()
             if res == 0:
                 # Successfully identified SRID.
                 srid = int(sr.GetAuthorityCode(None))
                 logger.debug("GDAL returned SRID %s: %s" % (srid, filename))
-                return srid
+
+        # Attempt to identify SRID using local spatial_ref_sys index.
+        if srid is None:
+            index = self._get_srid_index()
+            srid = index.get(('wkt', _normalize_wkt(wkt)))
+            if srid is None and proj4:
+                srid = index.get(('proj4', _normalize_proj4(proj4)))
+            if srid is not None:
+                logger.debug("spatial_ref_sys matched SRID %s: %s"
+                             % (srid, filename))
 
         # Try querying prj2EPSG API.
-        params = urllib.parse.urlencode({'terms': wkt, 'mode': 'wkt'})
-        resp = urllib.request.urlopen('http://prj2epsg.org/search.json?'
-                                      + params)
-        data = json.load(resp)
-        if data['exact']:
-            # Successfully identified SRID.
-            srid = int(data['codes'][0]['code'])
-            logger.debug("prj2EPSG API returned SRID %s: %s"
-                         % (srid, filename))
+        if srid is None and not self.offline:
+            params = urllib.parse.urlencode({'terms': wkt, 'mode': 'wkt'})
+            try:
+                resp = urllib.request.urlopen(
+                    'http://prj2epsg.org/search.json?' + params)
+                data = json.load(resp)
+            except (IOError, ValueError) as e:
+                logger.warn("prj2EPSG API unavailable: %s" % e)
+            else:
+                if data['exact']:
+                    # Successfully identified SRID.
+                    srid = int(data['codes'][0]['code'])
+                    logger.debug("prj2EPSG API returned SRID %s: %s"
+                                 % (srid, filename))
+
+        if srid is not None:
+            if self._srid_auth.get(srid, 'EPSG') == 'EPSG':
+                # Only cache EPSG SRIDs, which are the same in any database.
+                cache[prj_hash] = srid
+                self._save_srid_cache()
             return srid
 
-        # Unable to identify EPSG SRID. Use custom SRID.
+        # Unable to identify SRID. Define custom projection.
         srs = self.tables.public.spatial_ref_sys
-        with self.database.session() as sess:
-            srid = sess.query(srs.srid).filter(srs.srtext == wkt).first()
-        if srid:
-            return srid[0]
+        if gdal:
+            # Need to define custom projection since not in database.
+            logger.warn("Defining custom projection: %s" % filename)
+            if not proj4:
+                raise RuntimeError("Unable to project: %s" % filename)
+            with self.database.session() as sess:
+                srid = sess.query(func.max(srs.srid)).one()[0] + 1
+                projection = srs(srid=srid,
+                                 auth_name="custom", auth_srid=srid,
+                                 srtext=wkt, proj4text=proj4)
+                sess.add(projection)
+            srid = projection.srid
+            self._get_srid_index()[('wkt', _normalize_wkt(wkt))] = srid
+            self._srid_auth[srid] = "custom"
         else:
-            if gdal:
-                # Need to define custom projection since not in database.
-                logger.warn("Defining custom projection: %s" % filename)
-                proj4 = sr.ExportToProj4().strip()
-                if not proj4:
-                    raise RuntimeError("Unable to project: %s" % filename)
-                with self.database.session() as sess:
-                    srid = sess.query(func.max(srs.srid)).one()[0] + 1
-                    projection = srs(srid=srid,
-                                     auth_name="custom", auth_srid=srid,
-                                     srtext=wkt, proj4text=proj4)
-                    sess.add(projection)
-                srid = projection.srid
-            else:
-                raise RuntimeError("No GDAL: unable to define projection.")
+            raise RuntimeError("No GDAL: unable to define projection.")
         logger.debug("Using custom SRID %s: %s" % (srid, filename))
         return srid
 
+    def _get_srid_index(self):
+        """Return index of spatial_ref_sys SRIDs, built on first use.
+
+        The index maps ('wkt', normalized srtext) and ('proj4', normalized
+        proj4text) keys to SRIDs. Where several SRIDs share a definition,
+        EPSG SRIDs are preferred, then the lowest SRID.
+
+        """
+        if self._srid_index is None:
+            index = {}
+            with self.database.cursor() as cur:
+                cur.execute("""
+                    SELECT srid, auth_name, srtext, proj4text
+                    FROM spatial_ref_sys
+                    ORDER BY auth_name = 'EPSG', srid DESC;
+                """)
+                for (srid, auth_name, srtext, proj4text) in cur:
+                    # Later rows take precedence.
+                    if srtext:
+                        index[('wkt', _normalize_wkt(srtext))] = srid
+                    if proj4text:
+                        index[('proj4', _normalize_proj4(proj4text))] = srid
+                    self._srid_auth[srid] = auth_name
+            self._srid_index = index
+        return self._srid_index
+
+    def _load_srid_cache(self):
+        """Return persistent cache of SRIDs keyed by prj hash."""
+        if self._srid_cache is None:
+            self._srid_cache = {}
+            if self.srid_cache and os.path.exists(self.srid_cache):
+                try:
+                    with open(self.srid_cache) as cache_file:
+                        self._srid_cache = json.load(cache_file)
+                except (IOError, ValueError) as e:
+                    logger.warn("Unable to read SRID cache %s: %s"
+                                % (self.srid_cache, e))
+        return self._srid_cache
+
+    def _save_srid_cache(self):
+        """Write persistent cache of SRIDs keyed by prj hash."""
+        if not self.srid_cache:
+            return
+        try:
+            cache_dir = os.path.dirname(self.srid_cache)
+            if cache_dir and not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            # Write to temporary file and rename, so that the cache is
+            # never left partially written.
+            tmp_filename = self.srid_cache + '.tmp'
+            with open(tmp_filename, 'w') as cache_file:
+                json.dump(self._srid_cache, cache_file, indent=0,
+                          sort_keys=True)
+            os.rename(tmp_filename, self.srid_cache)
+        except (IOError, OSError) as e:
+            logger.warn("Unable to write SRID cache %s: %s"
+                        % (self.srid_cache, e))
+
     def load_shp(self, filename, table, srid=None, encoding=None,
-                 drop=False, append=False):
+                 drop=False, append=False, engine='shp2pgsql',
+                 defer_index=False, maintenance_work_mem=None,
+                 unlogged=None, target_srid=None, force=False,
+                 chunk_size=None, cluster=None):
         """Load a shapefile from the directory into a PostGIS table.
 
-        This is a Python wrapper for shp2gpsql. shp2pgsql is spawned by
-        subprocess. Commands generated by shp2pgsql are executed on a
-        psycopg2 cursor object. For performance, the PostgreSQL "dump"
+        By default, this is a Python wrapper for shp2gpsql. shp2pgsql is
+        spawned by subprocess. Commands generated by shp2pgsql are executed
+        on a psycopg2 cursor object. For performance, the PostgreSQL "dump"
         format is used instead of the default "insert" SQL format.
 
+        Alternatively, the "ogr" engine reads records with OGR and streams
+        them to PostGIS in binary COPY format with WKB geometry, without
+        the shp2pgsql subprocess or any text formatting and parsing.
+        Like shp2pgsql, it creates a gid serial primary key, lowercases
+        column names, promotes polygons and linestrings to MULTI types,
+        and creates a GIST index on the geom column.
+
+        If defer_index, the table is created without its spatial index,
+        which is built after all data is copied instead of maintained row
+        by row. The table is then analyzed, so that the query planner has
+        statistics immediately. This is much faster for large files.
+
+        If target_srid differs from the shapefile SRID, geometries are
+        reprojected while loading by OGR, using the spatial_ref_sys
+        definitions, so the table is written only once. The "ogr" engine
+        is then used, as shp2pgsql cannot reproject in COPY mode.
+        This avoids reprojecting later with conform_srids or reproject,
+        which rewrites the whole table and its indexes a second time.
+
+        If the manifest attribute is set, loading is skipped if the table
+        exists and the manifest shows that it was loaded from identical
+        files (same size and modification time, or same content hash)
+        in the same SRID, unless forced. Loads that create a table are
+        recorded in the manifest in the same transaction.
+
+        If chunk_size is specified, the "ogr" engine commits every
+        chunk_size features, together with the offset of the next feature
+        in the checkpoint table. If loading is interrupted, loading the
+        same unchanged files into the same table again resumes from the
+        last committed feature, instead of dropping the table and starting
+        over. The load rate is logged after each chunk.
+
+        If cluster is specified, the table is physically reordered by
+        location after loading, like cluster_spatial, so that spatial
+        joins read contiguous pages instead of rows in shapefile order.
+
         Args:
             filename: Shapefile, relative to the data directory.
             table:    PostGIS table name (optionally schema-qualified).
@@ -331,8 +615,69 @@ class TableLoader(object):
                       Defaults to False.
             append:   Whether to append to an existing table, instead of
                       creating one. Defaults to False.
+            engine:   Loader engine, either "shp2pgsql" or "ogr".
+                      Defaults to "shp2pgsql".
+            defer_index: Whether to build the spatial index and analyze
+                      after loading data. Defaults to False.
+            maintenance_work_mem: Memory for building the deferred index,
+                      like "1GB". Defaults to the server setting.
+            unlogged: Whether to create the table as UNLOGGED, for staging
+                      data that can be reloaded from the file. Use promote
+                      once the data is validated. Defaults to the unlogged
+                      attribute.
+            target_srid: SRID to reproject geometries into while loading,
+                      like the project SRID (srid attribute). If None,
+                      geometries are loaded in their original SRID.
+            force:    Whether to load even if the manifest shows that the
+                      files are unchanged. Defaults to False.
+            chunk_size: Number of features to commit at a time, for
+                      resumable loading with the "ogr" engine. If None,
+                      all features are loaded in one transaction.
+            cluster:  Method to cluster the table by location after
+                      loading, "gist" or "geohash", or None to keep
+                      shapefile order. Defaults to None.
+
+        Returns:
+            loaded:   False if loading was skipped, otherwise True.
+
+        """
+        if self.manifest:
+            self._create_manifest()
+        if chunk_size:
+            self._create_checkpoint()
+
+        with self.database.cursor() as cur:
+            loaded = self._load_shp(cur, filename, table, srid=srid,
+                                    encoding=encoding, drop=drop,
+                                    append=append, engine=engine,
+                                    defer_index=defer_index,
+                                    maintenance_work_mem=maintenance_work_mem,
+                                    unlogged=unlogged, target_srid=target_srid,
+                                    force=force, chunk_size=chunk_size,
+                                    cluster=cluster)
+
+        # Refresh ORM.
+        self.database.refresh()
+        return loaded
+
+    def _load_shp(self, cur, filename, table, srid=None, encoding=None,
+                  drop=False, append=False, engine='shp2pgsql',
+                  defer_index=False, maintenance_work_mem=None,
+                  unlogged=None, target_srid=None, force=False,
+                  chunk_size=None, cluster=None, manifest=True):
+        """Load a shapefile on a cursor, without refreshing the ORM.
+
+        Returns False if skipped because the files are unchanged. If not
+        manifest, the manifest is neither checked nor recorded.
 
         """
+        if engine not in ('shp2pgsql', 'ogr'):
+            raise ValueError("Unknown loader engine: %s" % engine)
+        if chunk_size and engine != 'ogr':
+            raise ValueError("Chunked loading requires the ogr engine.")
+        if unlogged is None:
+            unlogged = self.unlogged
+
         filepath = self.get_path(filename)
 
         # Make sure that shapefile exists and is readable.
@@ -348,56 +693,332 @@ class TableLoader(object):
         if not encoding:
             encoding = self.get_encoding(filename)
 
+        if target_srid and int(target_srid) == int(srid):
+            target_srid = None
+
+        # shp2pgsql rejects reprojection (-s FROM:TO) in COPY mode (-D),
+        # so reproject with OGR instead.
+        if target_srid and engine == 'shp2pgsql':
+            if not gdal:
+                raise RuntimeError("Reprojecting while loading requires "
+                                   "the GDAL Python bindings.")
+            engine = 'ogr'
+
+        # Skip loading if files are unchanged since the table was loaded.
+        track = self.manifest and manifest and not append
+        if track:
+            fingerprint = _Fingerprint(filepath)
+            if not force and self._unchanged(cur, table, fingerprint,
+                                             target_srid or srid):
+                logger.info("Skipping table %s, unchanged file %s."
+                            % (table, filename))
+                return False
+
+        # Resume from checkpoint of an interrupted chunked load of the
+        # same files.
+        checkpoint = chunk_size and not append
+        start = 0
+        if checkpoint:
+            start = self._get_checkpoint(cur, table, _Fingerprint(filepath))
+
         logger.info("Loading table %s (SRID: %s) from file %s (encoding: %s)."
                     % (table, srid, filename, encoding))
+        if target_srid:
+            logger.info("Reprojecting table %s into SRID %s while loading."
+                        % (table, target_srid))
+
+        if start:
+            logger.info("Resuming table %s from feature %s."
+                        % (table, start))
+        elif drop:
+            # Drop the existing table.
+            cur.execute('DROP TABLE IF EXISTS %s' % table)
+
+        # Index geometry with shp2pgsql, unless the index is deferred.
+        if defer_index:
+            index_args = []
+        else:
+            index_args = ['-I']
+
+        if engine == 'ogr':
+            if checkpoint:
+                def on_chunk(offset):
+                    # Commit chunk together with the checkpoint.
+                    self._set_checkpoint(cur, table, _Fingerprint(filepath),
+                                         offset)
+                    cur.connection.commit()
+            else:
+                on_chunk = None
+            _load_ogr(cur, filepath, table, srid, encoding=encoding,
+                      append=append or start > 0, promote_multi=True,
+                      index=not defer_index, unlogged=unlogged,
+                      target_srid=target_srid, chunk_size=chunk_size,
+                      start=start, on_chunk=on_chunk)
+            if checkpoint:
+                self._delete_checkpoint(cur, table)
+        else:
+            self._load_shp2pgsql(cur, filepath, table, str(srid), encoding,
+                                 append, index_args, unlogged)
+
+        if defer_index:
+            if not append:
+                _create_spatial_index(cur, table, maintenance_work_mem)
+            if not cluster:
+                cur.execute("ANALYZE {};".format(table))
+        if cluster:
+            _cluster_spatial(cur, table, cluster)
+
+        if track:
+            self._record(cur, table, fingerprint, target_srid or srid)
+        return True
+
+    def _create_checkpoint(self):
+        """Create chunked load checkpoint table if it does not exist."""
+        with self.database.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS {checkpoint} (
+                    table_name text PRIMARY KEY,
+                    source_path text NOT NULL,
+                    size bigint NOT NULL,
+                    mtime double precision NOT NULL,
+                    feature_offset bigint NOT NULL,
+                    updated_at timestamp with time zone DEFAULT now()
+                );
+            """.format(checkpoint=self.checkpoint))
+
+    def _get_checkpoint(self, cur, table, fingerprint):
+        """Return feature offset to resume loading table from, or 0.
+
+        A checkpoint is only valid if the table exists and the files have
+        the same path, size, and modification time.
+
+        """
+        cur.execute("SELECT to_regclass(%s);", (table,))
+        if cur.fetchone()[0] is None:
+            return 0
+        cur.execute("""
+            SELECT feature_offset FROM {checkpoint}
+            WHERE table_name = %s AND source_path = %s
+                AND size = %s AND mtime = %s;
+        """.format(checkpoint=self.checkpoint),
+            (table, os.path.abspath(fingerprint.path), fingerprint.size,
+             fingerprint.mtime))
+        row = cur.fetchone()
+        if row:
+            return row[0]
+        return 0
+
+    def _set_checkpoint(self, cur, table, fingerprint, offset):
+        """Record feature offset to resume loading table from."""
+        self._delete_checkpoint(cur, table)
+        cur.execute("""
+            INSERT INTO {checkpoint} (table_name, source_path, size, mtime,
+                                      feature_offset)
+            VALUES (%s, %s, %s, %s, %s);
+        """.format(checkpoint=self.checkpoint),
+            (table, os.path.abspath(fingerprint.path), fingerprint.size,
+             fingerprint.mtime, offset))
+
+    def _delete_checkpoint(self, cur, table):
+        """Delete checkpoint of a completed chunked load."""
+        cur.execute("DELETE FROM {} WHERE table_name = %s;".format(
+            self.checkpoint), (table,))
+
+    def _create_manifest(self, partitioned=False):
+        """Create load manifest table if it does not already exist.
+
+        If partitioned, a parent_table column is added if necessary, to
+        record the partitioned tables that loaded partitions belong to.
+
+        """
         with self.database.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS {manifest} (
+                    table_name text PRIMARY KEY,
+                    source_path text NOT NULL,
+                    size bigint NOT NULL,
+                    mtime double precision NOT NULL,
+                    content_hash text NOT NULL,
+                    srid integer,
+                    row_count bigint,
+                    loaded_at timestamp with time zone DEFAULT now()
+                );
+            """.format(manifest=self.manifest))
+            if partitioned:
+                cur.execute("""
+                    ALTER TABLE {manifest}
+                    ADD COLUMN IF NOT EXISTS parent_table text;
+                """.format(manifest=self.manifest))
+
+    def _unchanged(self, cur, table, fingerprint, srid):
+        """Return whether table exists and was loaded from identical files.
+
+        The content hash is only computed if size or modification time
+        differ from the manifest. If only the modification time changed,
+        the manifest is updated so that the hash is not computed again.
 
-            if drop:
-                # Drop the existing table.
-                cur.execute('DROP TABLE IF EXISTS %s' % table)
+        """
+        cur.execute("SELECT to_regclass(%s);", (table,))
+        if cur.fetchone()[0] is None:
+            return False
+        cur.execute("""
+            SELECT size, mtime, content_hash, srid FROM {manifest}
+            WHERE table_name = %s;
+        """.format(manifest=self.manifest), (table,))
+        row = cur.fetchone()
+        if not row:
+            return False
+        (size, mtime, content_hash, manifest_srid) = row
+        if manifest_srid != int(srid) or size != fingerprint.size:
+            return False
+        if mtime == fingerprint.mtime:
+            return True
+        if content_hash == fingerprint.content_hash:
+            cur.execute("""
+                UPDATE {manifest} SET mtime = %s WHERE table_name = %s;
+            """.format(manifest=self.manifest), (fingerprint.mtime, table))
+            return True
+        return False
 
-            if not append:
-                # Create the new table itself without adding actual data.
-                create_table = subprocess.Popen(['shp2pgsql', '-p', '-I',
-                                                 '-s', str(srid),
-                                                 '-W', encoding,
-                                                 filepath, table],
-                                                stdout=subprocess.PIPE,
-                                                stderr=subprocess.PIPE,
-                                                universal_newlines=True)
-                try:
-                    command = ""
-                    for line in create_table.stdout:
-                        if line and not (line.startswith("BEGIN") or
-                                         line.startswith("COMMIT")):
-                            command += line
-                    cur.execute(command)
-                finally:
-                    logf(logging.WARN, create_table.stderr)
-                create_table.wait()
-
-            # Append data to existing or newly-created table.
-            append_data = subprocess.Popen(['shp2pgsql', '-a', '-D', '-I',
-                                            '-s', str(srid),
-                                            '-W', encoding,
-                                            filepath, table],
-                                           stdout=subprocess.PIPE,
-                                           stderr=subprocess.PIPE,
-                                           universal_newlines=True)
+    def _record(self, cur, table, fingerprint, srid, parent=None):
+        """Record the fingerprint of a loaded table in the manifest.
+
+        If parent is specified, the table is recorded as a partition of
+        the parent table.
+
+        """
+        cur.execute("SELECT count(*) FROM {};".format(table))
+        row_count = cur.fetchone()[0]
+        cur.execute("""
+            DELETE FROM {manifest} WHERE table_name = %(table)s;
+            INSERT INTO {manifest} (table_name, source_path, size, mtime,
+                                    content_hash, srid, row_count{columns})
+            VALUES (%(table)s, %(path)s, %(size)s, %(mtime)s, %(hash)s,
+                    %(srid)s, %(row_count)s{values});
+        """.format(manifest=self.manifest,
+                   columns=', parent_table' if parent else '',
+                   values=', %(parent)s' if parent else ''), {
+            'table': table, 'path': os.path.abspath(fingerprint.path),
+            'size': fingerprint.size, 'mtime': fingerprint.mtime,
+            'hash': fingerprint.content_hash, 'srid': int(srid),
+            'row_count': row_count, 'parent': parent})
+
+    def _load_shp2pgsql(self, cur, filepath, table, srid_arg, encoding,
+                        append, index_args, unlogged=False):
+        """Load a shapefile on a cursor with shp2pgsql."""
+        if not append:
+            # Create the new table itself without adding actual data.
+            args = (['shp2pgsql', '-p'] + index_args +
+                    ['-s', srid_arg, '-W', encoding, filepath, table])
+            create_table = subprocess.Popen(args,
+                                            stdout=subprocess.PIPE,
+                                            stderr=subprocess.PIPE,
+                                            universal_newlines=True)
             try:
-                while True:
-                    line = append_data.stdout.readline()
-                    if line.startswith("COPY"):
-                        break
-                cur.copy_expert(line, append_data.stdout)
+                command = ""
+                for line in create_table.stdout:
+                    if line and not (line.startswith("BEGIN") or
+                                     line.startswith("COMMIT")):
+                        command += line
+                if unlogged:
+                    command = re.sub(r'^CREATE TABLE', 'CREATE UNLOGGED TABLE',
+                                     command, count=1, flags=re.MULTILINE)
+                cur.execute(command)
             finally:
-                logf(logging.WARN, append_data.stderr)
-            append_data.wait()
+                logf(logging.WARN, create_table.stderr)
+            create_table.wait()
+
+        # Append data to existing or newly-created table.
+        args = (['shp2pgsql', '-a', '-D'] + index_args +
+                ['-s', srid_arg, '-W', encoding, filepath, table])
+        append_data = subprocess.Popen(args,
+                                       stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE,
+                                       universal_newlines=True)
+        try:
+            while True:
+                line = append_data.stdout.readline()
+                if not line:
+                    raise RuntimeError("shp2pgsql produced no data for "
+                                       "file %s." % filepath)
+                if line.startswith("COPY"):
+                    break
+            cur.copy_expert(line, append_data.stdout)
+        finally:
+            logf(logging.WARN, append_data.stderr)
+        append_data.wait()
+
+    def load_vector(self, filename, table, layer=None, srid=None,
+                    encoding=None, drop=False, append=False,
+                    promote_multi=False, unlogged=None, target_srid=None):
+        """Load a vector layer of any OGR-supported format into PostGIS.
+
+        Features of formats like GeoPackage, GeoJSON, and FlatGeobuf, which
+        are not limited to 2 GB like shapefiles, are read with OGR and
+        streamed to PostGIS in binary COPY format with WKB geometry, like
+        load_shp with the "ogr" engine.
+
+        The table is created with a gid serial primary key, a lowercase
+        column for each attribute field, and a geom column. Unless
+        appending, the GIST index on the geom column is built after all
+        features are copied, and the table is then analyzed.
+
+        Args:
+            filename: Vector data source, relative to the data directory.
+            table:    PostGIS table name (optionally schema-qualified).
+            layer:    Layer name or index. Defaults to the first layer.
+            srid:     Spatial Reference System Identifier (SRID).
+                      If None, attempt to identify SRID from the layer
+                      projection information, like get_vector_srid.
+            encoding: Attribute encoding of shapefiles. If None, attempt
+                      to identify encoding from cpg or cst file. Other
+                      formats are read as UTF-8 by OGR.
+            drop:     Whether to drop a table that already exists.
+                      Defaults to False.
+            append:   Whether to append to an existing table, instead of
+                      creating one. Defaults to False.
+            promote_multi: Whether to promote polygons and linestrings to
+                      MULTI types, like shp2pgsql. Defaults to False.
+            unlogged: Whether to create the table as UNLOGGED. Defaults to
+                      the unlogged attribute.
+            target_srid: SRID to reproject geometries into while loading.
+                      If None, geometries are loaded in their original SRID.
+
+        Returns:
+            rows:     Number of features loaded.
+
+        """
+        if not gdal:
+            raise RuntimeError("No GDAL: unable to load vector data.")
+        if unlogged is None:
+            unlogged = self.unlogged
+        filepath = self.get_path(filename)
+        if not srid:
+            srid = self.get_vector_srid(filename, layer)
+        if not encoding and os.path.splitext(filename)[1].lower() == '.shp':
+            encoding = self.get_encoding(filename)
+        if target_srid and int(target_srid) == int(srid):
+            target_srid = None
+
+        logger.info("Loading table %s (SRID: %s) from file %s (layer: %s)."
+                    % (table, srid, filename, layer))
+        with self.database.cursor() as cur:
+            if drop and not append:
+                cur.execute("DROP TABLE IF EXISTS {};".format(table))
+            rows = _load_ogr(cur, filepath, table, srid, encoding=encoding,
+                             layer=layer, append=append,
+                             promote_multi=promote_multi, index=False,
+                             unlogged=unlogged, target_srid=target_srid)
+            if not append:
+                _create_spatial_index(cur, table)
+            cur.execute("ANALYZE {};".format(table))
 
         # Refresh ORM.
         self.database.refresh()
+        return rows
 
-    def load_shp_map(self, mapping):
+    def load_shp_map(self, mapping, workers=1, force=False,
+                     partition_table=None, partition_key='source'):
         """Load multiple shapefiles by mapping tables to filenames or kwargs.
 
         The shapefile dictionary should map each database table name to:
@@ -408,14 +1029,431 @@ class TableLoader(object):
 
         By default, existing tables will be dropped (drop=True).
 
+        If partition_table is specified, the shapefiles are instead loaded
+        into a single table partitioned by list on the partition_key
+        column, with one partition per shapefile. The dictionary keys are
+        then the partition key values, rather than table names. Each
+        partition is loaded into a staging table and attached at the end,
+        in one transaction, replacing any existing partition for the same
+        key value. The partitioned table is created if it does not exist.
+        Reloading a single shapefile thus swaps a single partition.
+
+        The shapefiles must share the same columns. If the partition_key
+        column does not exist in a shapefile, it is added with the key
+        value. Otherwise, all of its values must equal the key value.
+
+        Tables are skipped if the manifest shows that their shapefiles are
+        unchanged, unless forced. Partitions are recorded in the manifest
+        under their own names, together with the partitioned table name,
+        when they are attached.
+
+        With more than one worker, shapefiles are loaded concurrently,
+        each in its own transaction on a dedicated connection. SRIDs and
+        encodings are identified up front on the managed connection.
+        The ORM is refreshed once, after all shapefiles are loaded.
+
+        Args:
+            mapping: Dictionary mapping table names to filenames or kwargs.
+            workers: Number of shapefiles to load concurrently.
+                     Defaults to 1.
+            force:   Whether to load shapefiles even if unchanged.
+                     Defaults to False.
+            partition_table: Name of partitioned table to load shapefiles
+                     into (optionally schema-qualified), or None to load
+                     into separate tables.
+            partition_key: Name of partition key column.
+                     Defaults to "source".
+
+        Returns:
+            timings: Dictionary mapping table names (or partition key
+                     values) to load time (seconds).
+
+        """
+        if partition_table:
+            # Load each partition into a staging table, named after the
+            # partition that it replaces.
+            partitions = []
+            names = {}
+            for (key_value, value) in mapping.items():
+                partition = "{}_{}".format(
+                    partition_table,
+                    re.sub(r'\W+', '_', str(key_value)).lower())
+                if partition in names:
+                    raise ValueError(
+                        "Partition key values %r and %r both map to "
+                        "partition %s." % (names[partition], key_value,
+                                           partition))
+                names[partition] = key_value
+                partitions.append((key_value, partition + '_load',
+                                   partition))
+            mapping = dict((staging, mapping[key_value])
+                           for (key_value, staging, partition) in partitions)
+
+        jobs = []
+        for (table, value) in mapping.items():
+            if isinstance(value, string_types):
+                kwargs = {'filename': value}
+            else:
+                kwargs = dict(value)
+            if 'drop' not in kwargs:
+                kwargs['drop'] = True
+            if 'force' not in kwargs:
+                kwargs['force'] = force
+            jobs.append((table, kwargs))
+
+        if self.manifest:
+            self._create_manifest(partitioned=bool(partition_table))
+        if any(kwargs.get('chunk_size') for (table, kwargs) in jobs):
+            self._create_checkpoint()
+
+        records = []
+        if partition_table:
+            # Check and record partitions in the manifest, rather than the
+            # staging tables that are renamed when attached.
+            loaded_partitions = []
+            staged = dict((staging, (key_value, staging, partition))
+                          for (key_value, staging, partition) in partitions)
+            partition_jobs = []
+            for (table, kwargs) in jobs:
+                kwargs['manifest'] = False
+                if self.manifest:
+                    (key_value, staging, partition) = staged[table]
+                    if not kwargs.get('srid'):
+                        kwargs['srid'] = self.get_srid(kwargs['filename'])
+                    srid = kwargs.get('target_srid') or kwargs['srid']
+                    fingerprint = _Fingerprint(
+                        self.get_path(kwargs['filename']))
+                    with self.database.cursor() as cur:
+                        unchanged = self._unchanged(cur, partition,
+                                                    fingerprint, srid)
+                    if unchanged and not kwargs['force']:
+                        logger.info("Skipping partition %s, unchanged "
+                                    "file %s." % (partition,
+                                                  kwargs['filename']))
+                        continue
+                    records.append((partition, fingerprint, srid))
+                partition_jobs.append((table, kwargs))
+                loaded_partitions.append(staged[table])
+            jobs = partition_jobs
+
+        if workers > 1:
+            # Identify SRIDs and encodings serially, since this may
+            # require the managed connection and ORM session.
+            for (table, kwargs) in jobs:
+                if not kwargs.get('srid'):
+                    kwargs['srid'] = self.get_srid(kwargs['filename'])
+                if not kwargs.get('encoding'):
+                    kwargs['encoding'] = self.get_encoding(kwargs['filename'])
+
+        try:
+            timings = self._run_loads(self._load_shp, jobs, workers)
+            if partition_table:
+                if loaded_partitions:
+                    self._attach_partitions(partition_table, partition_key,
+                                            loaded_partitions, records)
+                timings = dict((key_value, timings.get(staging, 0.0))
+                               for (key_value, staging, partition)
+                               in partitions)
+        finally:
+            # Refresh ORM.
+            self.database.refresh()
+
+        return timings
+
+    def _run_loads(self, load, jobs, workers=1):
+        """Run load jobs, each in its own transaction.
+
+        With more than one worker, jobs run concurrently on dedicated
+        connections from a pool. Otherwise, jobs run sequentially on the
+        managed connection. The ORM is not refreshed.
+
+        Args:
+            load:    Load method, called with a cursor, table name, and
+                     keyword arguments, that returns whether it loaded.
+            jobs:    List of (table name, kwargs) tuples.
+            workers: Number of jobs to run concurrently. Defaults to 1.
+
+        Returns:
+            timings: Dictionary mapping table names to load time (seconds).
+
+        """
+        def run(job, pool=None):
+            (table, kwargs) = job
+            start = time.time()
+            if pool:
+                conn = pool.getconn()
+                try:
+                    with conn:
+                        with conn.cursor() as cur:
+                            loaded = load(cur, table=table, **kwargs)
+                finally:
+                    pool.putconn(conn)
+            else:
+                with self.database.cursor() as cur:
+                    loaded = load(cur, table=table, **kwargs)
+            elapsed = time.time() - start
+            if loaded:
+                logger.info("Loaded table %s in %.1f seconds."
+                            % (table, elapsed))
+            return elapsed
+
+        if workers > 1:
+            with self.database.pool(workers) as pool:
+                elapsed = parallel_map(lambda job: run(job, pool),
+                                       jobs, workers)
+        else:
+            elapsed = [run(job) for job in jobs]
+        return dict(zip([table for (table, kwargs) in jobs], elapsed))
+
+    def _attach_partitions(self, table, key, partitions, records=()):
+        """Attach staging tables as list partitions of a table.
+
+        Creates the partitioned table if it does not exist, like the first
+        staging table, and replaces existing partitions. Staging tables
+        that have the partition key column are checked to only contain
+        their key value first.
+
+        Args:
+            table:      Partitioned table name.
+            key:        Partition key column name.
+            partitions: List of (key value, staging table name,
+                        partition table name) tuples.
+            records:    List of (partition table name, fingerprint, SRID)
+                        tuples to record in the manifest once attached.
+
+        """
+        with self.database.cursor() as cur:
+            # Add partition key column to staging tables if necessary.
+            for (key_value, staging, partition) in partitions:
+                cur.execute("""
+                    SELECT count(*) FROM pg_attribute
+                    WHERE attrelid = %s::regclass AND attname = %s
+                        AND NOT attisdropped;
+                """, (staging, key))
+                if not cur.fetchone()[0]:
+                    cur.execute("""
+                        ALTER TABLE {staging}
+                        ADD COLUMN {key} text NOT NULL DEFAULT %s;
+                    """.format(staging=staging, key=key), (str(key_value),))
+                    continue
+
+                # Rows outside the partition bounds would fail the attach.
+                cur.execute("""
+                    SELECT {key}::text, count(*) FROM {staging}
+                    WHERE {key}::text IS DISTINCT FROM %s
+                    GROUP BY 1 ORDER BY 2 DESC LIMIT 1;
+                """.format(staging=staging, key=key), (str(key_value),))
+                row = cur.fetchone()
+                if row:
+                    raise ValueError(
+                        "Partition %s of table %s has %s rows with %s %r "
+                        "instead of %r." % (partition, table, row[1], key,
+                                            row[0], str(key_value)))
+
+            cur.execute("SELECT to_regclass(%s);", (table,))
+            if cur.fetchone()[0] is None:
+                _create_partitioned(cur, table, partitions[0][1], key)
+
+            # Swap each staging table in as a partition. Indexes and
+            # sequences are renamed too, so that the names are free for the
+            # next load of the same partition.
+            for (key_value, staging, partition) in partitions:
+                old_name = staging.split('.')[-1]
+                new_name = partition.split('.')[-1]
+                cur.execute("""
+                    SELECT n.nspname, c.relname, c.relkind
+                    FROM pg_class c
+                        JOIN pg_namespace n ON n.oid = c.relnamespace
+                    WHERE c.oid IN (
+                        SELECT indexrelid FROM pg_index
+                        WHERE indrelid = %(staging)s::regclass
+                        UNION
+                        SELECT objid FROM pg_depend
+                        WHERE refobjid = %(staging)s::regclass
+                            AND classid = 'pg_class'::regclass
+                            AND deptype = 'a'
+                    ) AND c.relkind IN ('i', 'S');
+                """, {'staging': staging})
+                relations = cur.fetchall()
+                cur.execute("DROP TABLE IF EXISTS {};".format(partition))
+                cur.execute("ALTER TABLE {} RENAME TO {};".format(
+                    staging, new_name))
+                for (schema, name, kind) in relations:
+                    if name.startswith(old_name):
+                        cur.execute('ALTER {} "{}"."{}" RENAME TO "{}";'
+                                    .format('INDEX' if kind == 'i'
+                                            else 'SEQUENCE',
+                                            schema, name,
+                                            new_name + name[len(old_name):]))
+                cur.execute("""
+                    ALTER TABLE {table} ATTACH PARTITION {partition}
+                    FOR VALUES IN (%s);
+                """.format(table=table, partition=partition),
+                    (str(key_value),))
+                logger.info("Attached partition %s of table %s."
+                            % (partition, table))
+
+            # Keep sequences of the partitioned table ahead of the values
+            # loaded into partitions.
+            for (sequence, column) in _owned_sequences(cur, table):
+                cur.execute("""
+                    SELECT setval(%s, greatest(max("{column}"), 1))
+                    FROM {table};
+                """.format(table=table, column=column), (sequence,))
+
+            for (partition, fingerprint, srid) in records:
+                self._record(cur, partition, fingerprint, srid, parent=table)
+
+    def load_delimited(self, filename, table, delimiter=',',
+                       encoding='UTF8', types=None, sample_rows=1000,
+                       drop=False, append=False, unlogged=None):
+        """Load a delimited text file from the directory into a table.
+
+        Column types are inferred from a sample of rows: columns with
+        only integers are bigint, columns with only numbers are double
+        precision, and other columns, including numbers with leading
+        zeros like FIPS codes and ZIP codes, are text. Column names are
+        lowercased, with runs of other characters than letters, digits,
+        and underscores replaced by underscores.
+
+        The file is then streamed from the client to the server with
+        COPY, in CSV format, so it need not be on the database server or
+        fit in memory. Empty fields are loaded as NULL. If later rows do
+        not fit the inferred types, the load fails; specify types for
+        those columns or increase sample_rows.
+
+        Args:
+            filename:  Delimited text file with a header row, relative to
+                       the data directory.
+            table:     PostgreSQL table name (optionally schema-qualified).
+            delimiter: Field delimiter character. Defaults to ",".
+            encoding:  PostgreSQL name of the file character encoding,
+                       like "UTF8", "LATIN1", or "WIN1252".
+                       Defaults to "UTF8".
+            types:     Dictionary mapping sanitized column names to
+                       PostgreSQL types, overriding inferred types.
+            sample_rows: Number of rows to infer column types from.
+                       Defaults to 1000.
+            drop:      Whether to drop a table that already exists.
+                       Defaults to False.
+            append:    Whether to append to an existing table, instead of
+                       creating one. Defaults to False.
+            unlogged:  Whether to create the table as UNLOGGED. Defaults
+                       to the unlogged attribute.
+
+        Returns:
+            rows:      Number of rows loaded.
+
+        """
+        with self.database.cursor() as cur:
+            rows = self._load_delimited(cur, filename, table,
+                                        delimiter=delimiter,
+                                        encoding=encoding, types=types,
+                                        sample_rows=sample_rows, drop=drop,
+                                        append=append, unlogged=unlogged)
+
+        # Refresh ORM.
+        self.database.refresh()
+        return rows
+
+    def _load_delimited(self, cur, filename, table, delimiter=',',
+                        encoding='UTF8', types=None, sample_rows=1000,
+                        drop=False, append=False, unlogged=None):
+        """Load a delimited text file on a cursor, without refreshing ORM.
+
+        See load_delimited for argument descriptions.
+
+        """
+        if unlogged is None:
+            unlogged = self.unlogged
+        filepath = self.get_path(filename)
+
+        # Infer column types from a sample of rows, as strings.
+        sample = pd.read_csv(filepath, sep=delimiter, nrows=sample_rows,
+                             dtype=str, keep_default_na=False,
+                             encoding=_python_codec(encoding))
+        columns = _sanitize_column_names(sample.columns)
+        column_types = [_infer_pg_type(sample[name])
+                        for name in sample.columns]
+        if types:
+            column_types = [types.get(column, column_type)
+                            for (column, column_type)
+                            in zip(columns, column_types)]
+        column_list = ", ".join('"{}"'.format(column) for column in columns)
+
+        logger.info("Loading table %s from file %s." % (table, filename))
+        if not append:
+            if drop:
+                cur.execute("DROP TABLE IF EXISTS {};".format(table))
+            cur.execute("CREATE {unlogged}TABLE {table} ({columns});".format(
+                unlogged='UNLOGGED ' if unlogged else '', table=table,
+                columns=", ".join('"{}" {}'.format(column, column_type)
+                                  for (column, column_type)
+                                  in zip(columns, column_types))))
+
+        copy_sql = cur.mogrify("""
+            COPY {table} ({columns}) FROM STDIN
+            WITH (FORMAT csv, HEADER true, DELIMITER %s, ENCODING %s);
+        """.format(table=table, columns=column_list), (delimiter, encoding))
+        with open(filepath, 'rb') as f:
+            cur.copy_expert(copy_sql, f, size=2 ** 20)
+        logger.info("Loaded %s rows into table %s."
+                    % (cur.rowcount, table))
+        return cur.rowcount
+
+    def load_delimited_map(self, mapping, workers=1):
+        """Load multiple delimited text files into tables.
+
+        The dictionary should map each database table name to:
+
+            - a delimited text filename to load, or
+            - dict-like keyword arguments to pass to the load_delimited
+              method, other than the table name.
+
+        By default, existing tables will be dropped (drop=True).
+
+        With more than one worker, files are loaded concurrently, each in
+        its own transaction on a dedicated connection. The ORM is
+        refreshed once, after all files are loaded.
+
+        Args:
+            mapping: Dictionary mapping table names to filenames or kwargs.
+            workers: Number of files to load concurrently. Defaults to 1.
+
+        Returns:
+            timings: Dictionary mapping table names to load time (seconds).
+
         """
+        jobs = []
         for (table, value) in mapping.items():
             if isinstance(value, string_types):
-                self.load_shp(filename=value, table=table, drop=True)
+                kwargs = {'filename': value}
             else:
-                if 'drop' not in value:
-                    value['drop'] = True
-                self.load_shp(table=table, **value)
+                kwargs = dict(value)
+            if 'drop' not in kwargs:
+                kwargs['drop'] = True
+            jobs.append((table, kwargs))
+
+        try:
+            return self._run_loads(self._load_delimited, jobs, workers)
+        finally:
+            # Refresh ORM.
+            self.database.refresh()
+
+    def promote(self, table):
+        """Make an UNLOGGED table logged (crash-safe) once validated.
+
+        This rewrites the table into the write-ahead log once, which is
+        cheaper than logging every row as it was loaded.
+
+        Args:
+            table: Table ORM class or PostGIS table name (optionally
+                   schema-qualified).
+
+        """
+        with self.database.cursor() as cur:
+            cur.execute("ALTER TABLE {} SET LOGGED;".format(
+                _qualified_name(table)))
 
 
 class TableFrame(object):
@@ -571,101 +1609,963 @@ class TableFrame(object):
             raise TypeError("TableFrame is read-only.")
 
 
-def update_df(df, column, table):
+def _sanitize_column_names(names):
+    """Return lowercase PostgreSQL column names without special characters.
+
+    Empty and duplicate names are replaced by names numbered by position.
+
     """
-    Add or update column in DataFrame from database table.
+    columns = []
+    for (i, name) in enumerate(names):
+        column = re.sub(r'\W+', '_', name.strip().lower()).strip('_')
+        if not column or column in columns:
+            column = 'column_{}'.format(i + 1)
+        columns.append(column)
+    return columns
 
-    Database table must contain column with the same name as
-    DataFrame's index (df.index.name).
 
-    Parameters
-    ----------
-    df : pandas.DataFrame
-        DataFrame to return an updated copy of.
-    column : sqlalchemy.orm.attributes.InstrumentedAttribute
-        Column ORM object to update DataFrame with.
-    table : sqlalchemy.ext.declarative.DeclarativeMeta
-        Table ORM class containing columns to update with and index on.
+def _infer_pg_type(values):
+    """Return PostgreSQL type fitting a Series of strings from a text file.
 
-    Returns
-    -------
-    df : pandas.DataFrame
+    Empty strings are ignored, since they are loaded as NULL.
 
     """
-    # Get table column to use as index based on DataFrame index name.
-    index_column = getattr(table, df.index.name)
+    values = values.str.strip()
+    values = values[values != '']
+    if values.empty or values.str.match(r'^[-+]?0\d').any():
+        return 'text'
+    if values.str.match(r'^[-+]?\d{1,18}$').all():
+        return 'bigint'
+    if pd.to_numeric(values, errors='coerce').notnull().all():
+        return 'double precision'
+    return 'text'
+
+
+def _index_statements(cur, source, target):
+    """
+    Return SQL statements to rebuild the indexes of a table on another.
 
-    # Query index column and column to update DataFrame with.
-    with db.session() as sess:
-        q = sess.query(index_column, column)
+    Primary key, unique, and exclusion constraints are added with their
+    source definitions, and other indexes are created with their source
+    definitions. Names starting with the source table name are renamed
+    after the target table; other names are prefixed by it.
 
-    # Update DataFrame column.
-    new_df = db_to_df(q, index_col=df.index.name)
-    df[column.name] = new_df[column.name]
-    return df
+    """
+    source_name = source.split('.')[-1]
+    target_name = target.split('.')[-1]
+
+    def rename(name):
+        return _index_name(name, source_name, target_name)
+
+    statements = []
+    cur.execute("""
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype IN ('p', 'u', 'x')
+        ORDER BY contype;
+    """, (source,))
+    for (name, definition) in cur.fetchall():
+        statements.append('ALTER TABLE {} ADD CONSTRAINT "{}" {};'.format(
+            target, rename(name), definition))
+
+    cur.execute("""
+        SELECT c.relname, pg_get_indexdef(i.indexrelid)
+        FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = %(source)s::regclass
+            AND i.indexrelid NOT IN (
+                SELECT conindid FROM pg_constraint
+                WHERE conrelid = %(source)s::regclass
+                    AND contype IN ('p', 'u', 'x'));
+    """, {'source': source})
+    for (name, definition) in cur.fetchall():
+        match = re.match(r'(CREATE (?:UNIQUE )?INDEX) .+? ON (?:ONLY )?\S+ '
+                         r'(USING .*)$', definition)
+        statements.append('{} "{}" ON {} {};'.format(
+            match.group(1), rename(name), target, match.group(2)))
+    return statements
+
+
+def _create_partitioned(cur, table, source, key):
+    """
+    Create a table partitioned by list on a key column, like a table.
 
+    Columns, defaults, and check constraints are copied from the source
+    table. Serial columns get sequences of their own. The primary key
+    is extended by the key column, as partitioned tables require, and
+    other non-unique indexes are created on the partitioned table, so
+    that partitions are attached with matching indexes.
 
-def add_column(table, column_name, type_name, default=None):
     """
-    Add column to table.
+    cur.execute("""
+        CREATE TABLE {table}
+            (LIKE {source} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+        PARTITION BY LIST ({key});
+    """.format(table=table, source=source, key=key))
+
+    for (_, column) in _owned_sequences(cur, source):
+        sequence = "{}_{}_seq".format(table, column)
+        cur.execute("""
+            CREATE SEQUENCE {sequence} OWNED BY {table}."{column}";
+            ALTER TABLE {table} ALTER COLUMN "{column}"
+                SET DEFAULT nextval('{sequence}'::regclass);
+        """.format(sequence=sequence, table=table, column=column))
+
+    cur.execute("""
+        SELECT a.attname
+        FROM pg_index i
+            JOIN pg_attribute a ON a.attrelid = i.indrelid
+                AND a.attnum = ANY(i.indkey)
+        WHERE i.indrelid = %s::regclass AND i.indisprimary
+        ORDER BY array_position(i.indkey::int2[], a.attnum);
+    """, (source,))
+    columns = [row[0] for row in cur.fetchall()]
+    if columns:
+        if key not in columns:
+            columns.append(key)
+        cur.execute("ALTER TABLE {} ADD PRIMARY KEY ({});".format(
+            table, ", ".join('"{}"'.format(c) for c in columns)))
+
+    cur.execute("""
+        SELECT pg_get_indexdef(indexrelid) FROM pg_index
+        WHERE indrelid = %s::regclass AND NOT indisunique;
+    """, (source,))
+    for (definition,) in cur.fetchall():
+        match = re.match(r'CREATE INDEX .+? ON (?:ONLY )?\S+ (USING .*)$',
+                         definition)
+        cur.execute("CREATE INDEX ON {} {};".format(table, match.group(1)))
+
+
+def _owned_sequences(cur, table):
+    """Return list of (sequence name, column name) tuples of a table."""
+    cur.execute("""
+        SELECT d.objid::regclass::text, a.attname
+        FROM pg_depend d
+            JOIN pg_class s ON s.oid = d.objid
+            JOIN pg_attribute a ON a.attrelid = d.refobjid
+                AND a.attnum = d.refobjsubid
+        WHERE d.refobjid = %s::regclass
+            AND d.classid = 'pg_class'::regclass
+            AND d.deptype = 'a' AND s.relkind = 'S';
+    """, (table,))
+    return cur.fetchall()
+
+
+def _index_name(name, source_name, target_name):
+    """Return name of an index of a source table, for a target table."""
+    if name.startswith(source_name):
+        name = target_name + name[len(source_name):]
+    else:
+        name = "{}_{}".format(target_name, name)
+    # PostgreSQL truncates identifiers to 63 bytes.
+    return name[:63]
+
+
+def rewrite_table(table, values, where=None, join=None):
+    """
+    Rewrite a table with new column values, instead of updating rows.
+
+    A new table is created like the table, without indexes, and filled
+    with INSERT ... SELECT, selecting the new values. Indexes and
+    constraints are then rebuilt from the definitions of the table, and
+    the new table replaces the table, all in one transaction.
+
+    Unlike an UPDATE of most rows, this does not leave a dead version of
+    every updated row and index entry behind, so the table stays compact
+    and no VACUUM is needed. The table is locked against writes while it
+    is rewritten. Privileges and dependent views and foreign keys are not
+    carried over: the swap fails if any depend on the table.
 
     Parameters
     ----------
     table : sqlalchemy.ext.declarative.DeclarativeMeta
-        Table ORM class to add column to.
-    column_name : str
-        Name of column to add to table.
-    type_name : str
-        Name of column type.
-    default : str, optional
-        Default value for column. Must include quotes if string.
+        Table ORM class to rewrite.
+    values : dict
+        Dictionary mapping column ORM objects or names to SQLAlchemy
+        expressions of their new values, like the values of an UPDATE.
+    where : sqlalchemy.sql.expression.ClauseElement, optional
+        Condition of rows to set new values in, like the WHERE clause of
+        an UPDATE. Other rows keep their values.
+    join : sqlalchemy.ext.declarative.DeclarativeMeta, optional
+        Other table that values and where refer to, like the FROM clause
+        of an UPDATE. It is left outer joined on where, and, like an
+        UPDATE, each row gets values from only one matching row.
+        Requires a primary key.
 
     Returns
     -------
-    column : sqlalchemy.orm.attributes.InstrumentedAttribute
-        Column ORM object that was added.
+    None
 
     """
-    if default:
-        default_str = "DEFAULT {}".format(default)
-    else:
-        default_str = ""
-
     t = table.__table__
+    source = "{}.{}".format(t.schema, t.name)
+    rewrite_name = "{}_rewrite".format(t.name)[:63]
+    target = "{}.{}".format(t.schema, rewrite_name)
+
+    values = dict((key if isinstance(key, string_types) else key.name, value)
+                  for (key, value) in values.items())
+    columns = []
+    for c in t.columns:
+        column = getattr(table, c.name)
+        if c.name in values:
+            value = values[c.name]
+            if where is not None:
+                value = case([(where, value)], else_=column)
+            column = value.label(c.name)
+        columns.append(column)
+
+    with db.session() as sess:
+        q = sess.query(*columns).select_from(table)
+        if join is not None:
+            pk = [getattr(table, c.name) for c in t.primary_key.columns]
+            if not pk:
+                raise ValueError("Table %s has no primary key." % source)
+            q = q.outerjoin(join, where).distinct(*pk).order_by(*pk)
+    (sql, params) = _query_sql(q)
+
+    start = time.time()
     with db.cursor() as cur:
+        cur.execute("LOCK TABLE {} IN EXCLUSIVE MODE;".format(source))
         cur.execute("""
-            ALTER TABLE {schema}.{table}
-            ADD COLUMN {column} {type} {default_str};
-        """.format(
-            schema=t.schema, table=t.name,
-            column=column_name, type=type_name, default_str=default_str))
+            CREATE TABLE {target}
+                (LIKE {source} INCLUDING ALL EXCLUDING INDEXES);
+        """.format(source=source, target=target))
+        cur.execute("INSERT INTO {} ({}) {};".format(
+            target, ", ".join('"{}"'.format(c.name) for c in t.columns),
+            sql), params)
+        for statement in _index_statements(cur, source, target):
+            cur.execute(statement)
+
+        # Keep sequences, like those of serial columns, owned by the
+        # source table from being dropped with it.
+        cur.execute("""
+            SELECT d.objid::regclass::text, a.attname
+            FROM pg_depend d
+                JOIN pg_class s ON s.oid = d.objid
+                JOIN pg_attribute a ON a.attrelid = d.refobjid
+                    AND a.attnum = d.refobjsubid
+            WHERE d.refobjid = %s::regclass
+                AND d.classid = 'pg_class'::regclass
+                AND d.deptype = 'a' AND s.relkind = 'S';
+        """, (source,))
+        for (sequence, column) in cur.fetchall():
+            cur.execute('ALTER SEQUENCE {} OWNED BY {}."{}";'.format(
+                sequence, target, column))
+
+        # Swap tables, restoring the original index names.
+        cur.execute("""
+            SELECT c.relname FROM pg_index i
+                JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE i.indrelid = %s::regclass;
+        """, (source,))
+        index_names = [row[0] for row in cur.fetchall()]
+        cur.execute("DROP TABLE {};".format(source))
+        cur.execute('ALTER TABLE {} RENAME TO "{}";'.format(target, t.name))
+        for name in index_names:
+            cur.execute('ALTER INDEX "{}"."{}" RENAME TO "{}";'.format(
+                t.schema, _index_name(name, t.name, rewrite_name), name))
+        cur.execute("ANALYZE {};".format(source))
+    logger.info("Rewrote table %s in %.1f seconds."
+                % (source, time.time() - start))
+
+    # Refresh ORM.
     db.refresh()
-    return getattr(table, column_name)
 
 
-def remove_column(column):
-    """Remove column from table."""
-    col = column.property.columns[0]
-    t = col.table
-    with db.cursor() as cur:
-        cur.execute("""
-            ALTER TABLE {schema}.{table}
-            DROP COLUMN {column};
-        """.format(schema=t.schema, table=t.name, column=col.name))
-    db.refresh()
+def parallel_update(table, values, where=None, workers=4, chunks=None,
+                    retries=2, progress=None, done=None):
+    """
+    Update table rows concurrently, in chunks of primary key or ctid ranges.
 
+    The table is split into ranges of its integer primary key, or of
+    physical row locations (ctid) if it has none. The same UPDATE,
+    restricted to one range, is executed for each range on a pool of
+    dedicated connections, each range in its own transaction. A chunk
+    that fails is retried, then the error is raised.
 
-def exec_sql(query, params=None):
-    """Execute SQL query."""
-    with db.cursor() as cur:
-        cur.execute(query, params)
+    Only PostgreSQL 14 and later scan ctid ranges directly; earlier
+    versions would scan the whole table for every chunk. Tables without
+    an integer primary key are therefore updated with a single UPDATE
+    on earlier versions.
 
+    As chunks are committed separately, the update as a whole is not
+    atomic. An interrupted update can be resumed by passing the same
+    done set again, which skips the chunks it holds. Chunks of ctid
+    ranges do not stay stable as rows are updated, so resuming and
+    non-idempotent values require an integer primary key.
 
-def db_to_query(orm):
-    """Convert table or list of ORM objects to a query."""
-    if isinstance(orm, Query):
-        # Assume input is Query object.
-        return orm
+    Parameters
+    ----------
+    table : sqlalchemy.ext.declarative.DeclarativeMeta
+        Table ORM class to update.
+    values : dict
+        Dictionary mapping column ORM objects or names to SQLAlchemy
+        expressions of their new values.
+    where : sqlalchemy.sql.expression.ClauseElement, optional
+        Condition of rows to update. It may refer to other tables, which
+        are added to the FROM clause of the UPDATE.
+    workers : int, optional
+        Number of concurrent connections. Default is 4.
+    chunks : int, optional
+        Number of ranges to split the table into.
+        Defaults to four per worker.
+    retries : int, optional
+        Number of times to retry a failed chunk. Default is 2.
+    progress : callable, optional
+        Function called with the numbers of finished and total chunks
+        after each chunk is committed.
+    done : set, optional
+        Set of (low, high) bounds of finished chunks, updated as chunks
+        are committed.
+
+    Returns
+    -------
+    rows : int
+        Number of rows updated.
+
+    """
+    t = table.__table__
+    source = "{}.{}".format(t.schema, t.name)
+    values = dict((key if isinstance(key, string_types) else key.name, value)
+                  for (key, value) in values.items())
+    if chunks is None:
+        chunks = workers * 4
+    if done is None:
+        done = set()
+
+    # Split table into ranges of integer primary key or ctid.
+    pk = list(t.primary_key.columns)
+    with db.cursor() as cur:
+        if len(pk) == 1 and isinstance(pk[0].type, Integer):
+            key = pk[0]
+            cur.execute('SELECT min("{0}"), max("{0}") FROM {1};'.format(
+                key.name, source))
+            (low, high) = cur.fetchone()
+            if low is None:
+                return 0
+            size = high - low + 1
+        elif _tid_range_scans(cur.connection):
+            key = None
+            cur.execute("""
+                SELECT pg_relation_size(%s::regclass) /
+                    current_setting('block_size')::int;
+            """, (source,))
+            (low, size) = (0, cur.fetchone()[0])
+        else:
+            logger.info("Updating table %s without integer primary key "
+                        "in a single chunk." % source)
+            (key, low, size) = (None, None, 1)
+    chunks = max(1, min(chunks, size))
+    if low is None:
+        bounds = [None, None]
+    else:
+        bounds = [low + size * i // chunks for i in range(chunks)] + [None]
+    ranges = [r for r in zip(bounds[:-1], bounds[1:]) if r not in done]
+
+    def statement(lo, hi):
+        """Compile UPDATE of rows within range into SQL and parameters."""
+        conditions = [] if where is None else [where]
+        if lo is not None and key is not None:
+            conditions.append(key >= lo)
+            if hi is not None:
+                conditions.append(key < hi)
+        elif lo is not None:
+            conditions.append(text(
+                "{}.ctid >= '({},0)'::tid".format(source, lo)))
+            if hi is not None:
+                conditions.append(text(
+                    "{}.ctid < '({},0)'::tid".format(source, hi)))
+        update = t.update().values(values)
+        if conditions:
+            update = update.where(and_(*conditions))
+        compiled = update.compile(dialect=db._engine.dialect)
+        return (str(compiled), compiled.params)
+
+    lock = threading.Lock()
+    total = len(ranges) + len(done)
+
+    start = time.time()
+    with db.pool(workers) as pool:
+        def update(bound):
+            (sql, params) = statement(*bound)
+            for attempt in range(retries + 1):
+                conn = pool.getconn()
+                try:
+                    with conn:
+                        with conn.cursor() as cur:
+                            cur.execute(sql, params)
+                            rows = cur.rowcount
+                    break
+                except psycopg2.Error as e:
+                    if attempt == retries:
+                        raise
+                    logger.warn("Retrying update of %s chunk %s: %s"
+                                % (source, bound, e))
+                finally:
+                    pool.putconn(conn)
+            with lock:
+                done.add(bound)
+                if progress is not None:
+                    progress(len(done), total)
+            return rows
+
+        rows = sum(parallel_map(update, ranges, workers))
+    logger.info("Updated %s rows of %s in %.1f seconds."
+                % (rows, source, time.time() - start))
+    return rows
+
+
+def _parallel_copy(source, target, workers):
+    """
+    Copy all rows of a table into another concurrently, in ctid ranges.
+
+    Each range is copied in its own transaction on a dedicated
+    connection, using the snapshot exported by another transaction.
+    Without TID range scans, all rows are copied in one statement.
+
+    """
+    with db.cursor() as cur:
+        if not _tid_range_scans(cur.connection):
+            cur.execute("INSERT INTO {} SELECT * FROM {};".format(
+                target, source))
+            rows = cur.rowcount
+            logger.info("Copied %s rows from %s to %s."
+                        % (rows, source, target))
+            return rows
+        cur.execute("""
+            SELECT pg_relation_size(%s::regclass) /
+                current_setting('block_size')::int;
+        """, (source,))
+        nblocks = cur.fetchone()[0]
+    nchunks = workers * 4
+    bounds = [nblocks * i // nchunks for i in range(nchunks)] + [None]
+    chunks = list(zip(bounds[:-1], bounds[1:]))
+
+    with db.pool(workers + 1) as pool:
+        # Hold a transaction open to share its snapshot with workers.
+        snapshot_conn = pool.getconn()
+        try:
+            with snapshot_conn.cursor() as cur:
+                cur.execute("""
+                    SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;
+                    SELECT pg_export_snapshot();
+                """)
+                snapshot = cur.fetchone()[0]
+
+            def copy(chunk):
+                (lo, hi) = chunk
+                where = "ctid >= '({},0)'::tid".format(lo)
+                if hi is not None:
+                    where += " AND ctid < '({},0)'::tid".format(hi)
+                conn = pool.getconn()
+                try:
+                    with conn:
+                        with conn.cursor() as cur:
+                            cur.execute("""
+                                SET TRANSACTION ISOLATION LEVEL
+                                    REPEATABLE READ;
+                                SET TRANSACTION SNAPSHOT %s;
+                            """, (snapshot,))
+                            cur.execute("""
+                                INSERT INTO {target}
+                                SELECT * FROM {source} WHERE {where};
+                            """.format(target=target, source=source,
+                                       where=where))
+                            return cur.rowcount
+                finally:
+                    pool.putconn(conn)
+
+            rows = sum(parallel_map(copy, chunks, workers))
+        finally:
+            snapshot_conn.rollback()
+            pool.putconn(snapshot_conn)
+    logger.info("Copied %s rows from %s to %s." % (rows, source, target))
+    return rows
+
+
+def _tid_range_scans(conn):
+    """Return whether the server scans ctid ranges without full scans."""
+    return conn.server_version >= 140000
+
+
+def _parallel_execute(statements, workers):
+    """Execute SQL statements concurrently on dedicated connections."""
+    with db.pool(workers) as pool:
+        def execute(statement):
+            conn = pool.getconn()
+            try:
+                with conn:
+                    with conn.cursor() as cur:
+                        cur.execute(statement)
+            finally:
+                pool.putconn(conn)
+        parallel_map(execute, statements, workers)
+
+
+def _qualified_name(table):
+    """Return schema-qualified name of a table ORM class or table name."""
+    if isinstance(table, string_types):
+        return table
+    t = table.__table__
+    return "{}.{}".format(t.schema, t.name)
+
+
+def update_df(df, column, table, incremental=False):
+    """
+    Add or update column in DataFrame from database table.
+
+    Database table must contain column with the same name as
+    DataFrame's index (df.index.name).
+
+    If incremental, only rows modified since the DataFrame column was
+    last synchronized from the table are transferred, by comparing the
+    transaction ID (xmin) of each row against a snapshot recorded at the
+    previous synchronization. The DataFrame column is then patched in
+    place. Deleted rows are not detected. The first synchronization of
+    a column, or one after transaction ID wraparound, is always a full
+    transfer.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        DataFrame to return an updated copy of.
+    column : sqlalchemy.orm.attributes.InstrumentedAttribute
+        Column ORM object to update DataFrame with.
+    table : sqlalchemy.ext.declarative.DeclarativeMeta
+        Table ORM class containing columns to update with and index on.
+    incremental : bool, optional
+        Whether to only transfer rows modified since the last
+        synchronization. Defaults to False.
+
+    Returns
+    -------
+    df : pandas.DataFrame
+
+    """
+    # Get table column to use as index based on DataFrame index name.
+    index_column = getattr(table, df.index.name)
+    t = table.__table__
+    sync_key = (t.schema, t.name, column.name)
+
+    # Look up the snapshot recorded when this DataFrame column was last
+    # synchronized from the table.
+    since = None
+    if incremental and column.name in df.columns:
+        since = _get_sync_xmin(df, sync_key)
+
+    # Record a snapshot before querying. Rows modified by transactions
+    # older than the snapshot xmin are guaranteed to be included below.
+    with db.cursor() as cur:
+        cur.execute("""
+            SELECT txid_snapshot_xmin(txid_current_snapshot()) % 4294967296;
+        """)
+        snapshot_xmin = int(cur.fetchone()[0])
+    if since is not None and snapshot_xmin < since:
+        # Transaction ID wraparound. Fall back to a full transfer.
+        since = None
+
+    # Query index column and column to update DataFrame with.
+    with db.session() as sess:
+        q = sess.query(index_column, column)
+        if since is not None:
+            q = q.filter(text(
+                "CAST(CAST({}.{}.xmin AS text) AS bigint) >= :since".format(
+                    t.schema, t.name)
+            ).bindparams(since=since))
+
+    # Update DataFrame column.
+    new_df = db_to_df(q, index_col=df.index.name)
+    if since is None:
+        df[column.name] = new_df[column.name]
+    else:
+        changed = new_df[new_df.index.isin(df.index)]
+        df.loc[changed.index, column.name] = changed[column.name]
+        logger.debug("Transferred %s changed rows of %s.%s."
+                     % (len(changed), t.name, column.name))
+    _set_sync_xmin(df, sync_key, snapshot_xmin)
+    return df
+
+
+# Snapshot xmin of the last synchronization of each DataFrame column,
+# keyed by DataFrame id. Weak references detect reuse of ids by new objects.
+_df_sync = {}
+
+
+def _get_sync_xmin(df, sync_key):
+    """Return snapshot xmin of last column synchronization, or None."""
+    entry = _df_sync.get(id(df))
+    if entry is None or entry[0]() is not df:
+        return None
+    return entry[1].get(sync_key)
+
+
+def _set_sync_xmin(df, sync_key, xmin):
+    """Record snapshot xmin of a column synchronization."""
+    entry = _df_sync.get(id(df))
+    if entry is None or entry[0]() is not df:
+        df_id = id(df)
+        entry = (weakref.ref(df, lambda ref: _df_sync.pop(df_id, None)), {})
+        _df_sync[df_id] = entry
+    entry[1][sync_key] = xmin
+
+
+def add_column(table, column_name, type_name, default=None):
+    """
+    Add column to table.
+
+    Parameters
+    ----------
+    table : sqlalchemy.ext.declarative.DeclarativeMeta
+        Table ORM class to add column to.
+    column_name : str
+        Name of column to add to table.
+    type_name : str
+        Name of column type.
+    default : str, optional
+        Default value for column. Must include quotes if string.
+
+    Returns
+    -------
+    column : sqlalchemy.orm.attributes.InstrumentedAttribute
+        Column ORM object that was added.
+
+    """
+    if default:
+        defaults = {column_name: default}
+    else:
+        defaults = None
+    return add_columns(table, {column_name: type_name}, defaults)[0]
+
+
+def add_columns(table, columns, defaults=None):
+    """
+    Add multiple columns to table with a single ALTER TABLE statement.
+
+    The table is locked and the ORM is refreshed only once, regardless
+    of the number of columns added.
+
+    Parameters
+    ----------
+    table : sqlalchemy.ext.declarative.DeclarativeMeta
+        Table ORM class to add columns to.
+    columns : dict or iterable of (str, str) tuples
+        Mapping of names of columns to add to names of column types.
+        Use an ordered mapping or list of tuples to control column order.
+    defaults : dict, optional
+        Mapping of column names to default values. Values must include
+        quotes if strings.
+
+    Returns
+    -------
+    columns : list of sqlalchemy.orm.attributes.InstrumentedAttribute
+        Column ORM objects that were added, in order.
+
+    """
+    if hasattr(columns, 'items'):
+        columns = list(columns.items())
+    else:
+        columns = list(columns)
+    if not columns:
+        raise ValueError("No columns to add.")
+    if not defaults:
+        defaults = {}
+
+    add_clauses = []
+    for (column_name, type_name) in columns:
+        if column_name in defaults:
+            default_str = "DEFAULT {}".format(defaults[column_name])
+        else:
+            default_str = ""
+        add_clauses.append("ADD COLUMN {column} {type} {default_str}".format(
+            column=column_name, type=type_name, default_str=default_str))
+
+    t = table.__table__
+    with db.cursor() as cur:
+        cur.execute("""
+            ALTER TABLE {schema}.{table}
+            {add_clauses};
+        """.format(
+            schema=t.schema, table=t.name,
+            add_clauses=",\n            ".join(add_clauses)))
+    db.refresh()
+    return [getattr(table, column_name) for (column_name, _) in columns]
+
+
+def remove_column(column):
+    """Remove column from table."""
+    col = column.property.columns[0]
+    t = col.table
+    with db.cursor() as cur:
+        cur.execute("""
+            ALTER TABLE {schema}.{table}
+            DROP COLUMN {column};
+        """.format(schema=t.schema, table=t.name, column=col.name))
+    db.refresh()
+
+
+def cluster_spatial(table, method='gist', column='geom'):
+    """
+    Physically reorder table rows by location, then ANALYZE.
+
+    Rows loaded from shapefiles are stored in file order, so index scans
+    of spatial joins read pages all over the table. Clustering stores
+    nearby geometries on nearby pages. The table and its indexes are
+    rewritten under an exclusive lock. Rows inserted or updated later
+    are not kept in order, so cluster again after large changes.
+
+    Parameters
+    ----------
+    table : sqlalchemy.ext.declarative.DeclarativeMeta or str
+        Table ORM class or name (optionally schema-qualified) to cluster.
+    method : {'gist', 'geohash'}, optional
+        'gist' orders rows by the GIST index on the geometry column,
+        which is created if it does not exist. 'geohash' orders rows by
+        the geohash of the geometry centroids, a space-filling curve key
+        that keeps nearby geometries closer together; it falls back to
+        'gist' if the column has no SRID to transform from into
+        longitude and latitude. Defaults to 'gist'.
+    column : str, optional
+        Name of geometry column. Defaults to 'geom'.
+
+    Returns
+    -------
+    None
+
+    """
+    with db.cursor() as cur:
+        _cluster_spatial(cur, _qualified_name(table), method, column)
+
+
+def _cluster_spatial(cur, table, method='gist', column='geom'):
+    """Cluster a table by location on a cursor, then ANALYZE."""
+    start = time.time()
+    if method == 'geohash':
+        cur.execute("""
+            SELECT Find_SRID(n.nspname::varchar, c.relname::varchar, %s)
+            FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE c.oid = %s::regclass;
+        """, (column, table))
+        if not cur.fetchone()[0]:
+            logger.warn("Column %s of table %s has no SRID. Clustering by "
+                        "GIST index instead of geohash." % (column, table))
+            method = 'gist'
+    if method == 'gist':
+        index = _ensure_index(cur, table, column, 'gist',
+                              concurrently=False)
+        cur.execute('CLUSTER {} USING "{}";'.format(table, index))
+    elif method == 'geohash':
+        # Geohash requires longitude and latitude. Empty geometries have
+        # no centroid, so they are sorted last.
+        index = "{}_{}_geohash_idx".format(table.split('.')[-1],
+                                           column)[:63]
+        cur.execute("""
+            CREATE INDEX "{index}" ON {table} ((ST_GeoHash(ST_Transform(
+                ST_Centroid(CASE WHEN NOT ST_IsEmpty({column})
+                            THEN {column} END), 4326))));
+            CLUSTER {table} USING "{index}";
+            DROP INDEX {schema}"{index}";
+        """.format(index=index, table=table, column=column,
+                   schema=table.split('.')[0] + '.' if '.' in table
+                   else ''))
+    else:
+        raise ValueError("Unknown clustering method: %s" % method)
+    cur.execute("ANALYZE {};".format(table))
+    logger.info("Clustered table %s by %s in %.1f seconds."
+                % (table, method, time.time() - start))
+
+
+def ensure_index(table_or_column, kind=None, concurrently=True):
+    """
+    Create an index on a column unless a valid one already exists.
+
+    An index of the same kind whose first key column is the column is
+    reused. Invalid indexes left by failed concurrent builds are dropped
+    and rebuilt. Indexes are created on a dedicated autocommit
+    connection, so they can be built CONCURRENTLY, without blocking
+    writes to the table.
+
+    Parameters
+    ----------
+    table_or_column : sqlalchemy.orm.attributes.InstrumentedAttribute
+                      or sqlalchemy.ext.declarative.DeclarativeMeta
+        Column ORM object to index, or table ORM class to index all
+        geometry columns of.
+    kind : {'gist', 'btree'}, optional
+        Index access method. Defaults to 'gist' for geometry columns and
+        'btree' otherwise.
+    concurrently : bool, optional
+        Whether to build the index without locking out writes, which
+        takes longer. Defaults to True.
+
+    Returns
+    -------
+    indexes : list of str
+        Names of the existing or created indexes.
+
+    """
+    return ensure_indexes([(table_or_column, kind)],
+                          concurrently=concurrently)
+
+
+def ensure_indexes(specs, workers=1, concurrently=True):
+    """
+    Create indexes on many columns unless valid ones already exist.
+
+    Like ensure_index, but indexes are built concurrently on a pool of
+    dedicated autocommit connections.
+
+    Parameters
+    ----------
+    specs : list
+        Column ORM objects or table ORM classes, as for ensure_index,
+        or (column or table, kind) tuples. Kind defaults to 'gist' for
+        geometry columns and 'btree' otherwise.
+    workers : int, optional
+        Number of indexes to build concurrently. Defaults to 1.
+    concurrently : bool, optional
+        Whether to build indexes without locking out writes.
+        Defaults to True.
+
+    Returns
+    -------
+    indexes : list of str
+        Names of the existing or created indexes, once each.
+
+    """
+    jobs = []
+    for spec in specs:
+        if isinstance(spec, tuple):
+            (target, kind) = spec
+        else:
+            (target, kind) = (spec, None)
+        if isinstance(target, DeclarativeMeta):
+            t = target.__table__
+            columns = [c for c in t.columns
+                       if isinstance(c.type, Geometry)]
+        else:
+            columns = [target.property.columns[0]]
+        for column in columns:
+            if kind is None:
+                if isinstance(column.type, Geometry):
+                    column_kind = 'gist'
+                else:
+                    column_kind = 'btree'
+            else:
+                column_kind = kind
+            if column_kind not in ('gist', 'btree'):
+                raise ValueError("Unsupported index kind: %s" % column_kind)
+            t = column.table
+            job = ("{}.{}".format(t.schema, t.name), column.name,
+                   column_kind)
+            # Duplicate jobs would race to create the same index.
+            if job not in jobs:
+                jobs.append(job)
+
+    with db.pool(max(workers, 1)) as pool:
+        def ensure(job):
+            conn = pool.getconn()
+            try:
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    return _ensure_index(cur, *job,
+                                         concurrently=concurrently)
+            finally:
+                pool.putconn(conn)
+        return parallel_map(ensure, jobs, workers)
+
+
+def _ensure_index(cur, table, column, kind, concurrently=True):
+    """Create index on a column on an autocommit cursor, unless it exists."""
+    cur.execute("""
+        SELECT n.nspname, ci.relname, i.indisvalid
+        FROM pg_index i
+            JOIN pg_class ci ON ci.oid = i.indexrelid
+            JOIN pg_namespace n ON n.oid = ci.relnamespace
+            JOIN pg_am am ON am.oid = ci.relam
+            JOIN pg_attribute a ON a.attrelid = i.indrelid
+                AND a.attnum = i.indkey[0]
+        WHERE i.indrelid = %s::regclass AND a.attname = %s
+            AND am.amname = %s
+        ORDER BY i.indisvalid DESC;
+    """, (table, column, kind))
+    indexes = cur.fetchall()
+    for (schema, name, valid) in indexes:
+        if valid:
+            logger.debug("Using existing index %s." % name)
+            return name
+    for (schema, name, valid) in indexes:
+        logger.warn("Dropping invalid index %s." % name)
+        cur.execute('DROP INDEX {}"{}"."{}";'.format(
+            'CONCURRENTLY ' if concurrently else '', schema, name))
+
+    # PostgreSQL truncates identifiers to 63 bytes.
+    name = "{}_{}_{}_idx".format(table.split('.')[-1], column, kind)[:63]
+    start = time.time()
+    cur.execute('CREATE INDEX {}"{}" ON {} USING {} ("{}");'.format(
+        'CONCURRENTLY ' if concurrently else '', name, table, kind, column))
+    logger.info("Created index %s in %.1f seconds."
+                % (name, time.time() - start))
+    return name
+
+
+def index_usage(table=None):
+    """
+    Return DataFrame of index usage statistics, to check that queries use
+    the indexes that exist.
+
+    Counts are cumulative since statistics were last reset, so compare
+    counts before and after running a workload. Indexes that are never
+    scanned only slow down writes. Tables with many sequential scans and
+    tuples read may lack an index that the workload needs.
+
+    Parameters
+    ----------
+    table : sqlalchemy.ext.declarative.DeclarativeMeta, optional
+        Table ORM class to report indexes of. Defaults to all tables.
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        Indexed by schema, table, and index name, with columns:
+        definition, size (bytes), idx_scan (number of index scans),
+        idx_tup_read, table_seq_scan, table_seq_tup_read, and used
+        (whether the index was scanned).
+
+    """
+    where = ""
+    params = None
+    if table is not None:
+        where = "WHERE s.relid = %s::regclass"
+        params = (_qualified_name(table),)
+    with db.cursor() as cur:
+        cur.execute("""
+            SELECT s.schemaname AS schema, s.relname AS table,
+                s.indexrelname AS index,
+                pg_get_indexdef(s.indexrelid) AS definition,
+                pg_relation_size(s.indexrelid) AS size,
+                s.idx_scan, s.idx_tup_read,
+                t.seq_scan AS table_seq_scan,
+                t.seq_tup_read AS table_seq_tup_read
+            FROM pg_stat_user_indexes s
+                JOIN pg_stat_user_tables t ON t.relid = s.relid
+            {where}
+            ORDER BY s.schemaname, s.relname, s.indexrelname;
+        """.format(where=where), params)
+        columns = [column[0] for column in cur.description]
+        df = pd.DataFrame.from_records(cur.fetchall(), columns=columns)
+    df['used'] = df.idx_scan > 0
+    return df.set_index(['schema', 'table', 'index'])
+
+
+def exec_sql(query, params=None):
+    """Execute SQL query."""
+    with db.cursor() as cur:
+        cur.execute(query, params)
+
+
+def db_to_query(orm):
+    """Convert table or list of ORM objects to a query."""
+    if isinstance(orm, Query):
+        # Assume input is Query object.
+        return orm
     elif hasattr(orm, '__iter__') and not isinstance(orm, string_types):
         # Assume input is list of ORM objects.
         with db.session() as sess:
@@ -676,13 +2576,19 @@ def db_to_query(orm):
             return sess.query(orm)
 
 
-def db_to_db(query, table_name, schema=None, view=False, pk='id'):
+def db_to_db(query, table_name, schema=None, view=False, pk='id',
+             unlogged=False, temporary=False):
     """
     Create a table or view from Query, table, or ORM objects, like columns.
 
     Do not use to duplicate a table. The new table will not contain
     the same indexes or constraints.
 
+    The table is written once: the primary key values are generated by
+    row_number() in the CREATE TABLE AS statement, and then the primary
+    key constraint, a sequence for new keys, and GIST indexes on all
+    geometry columns are added, before the table is analyzed.
+
     Parameters
     ----------
     query : sqlalchemy.orm.Query, sqlalchemy.ext.declarative.DeclarativeMeta,
@@ -695,34 +2601,73 @@ def db_to_db(query, table_name, schema=None, view=False, pk='id'):
         Schema of table to create. Defaults to public.
     view : bool, optional
         Whether to create a view instead of a table. Defaults to False.
+    pk : str, optional
+        Name of integer primary key column to add to a table, or None.
+        Defaults to 'id'.
+    unlogged : bool, optional
+        Whether to create the table as UNLOGGED. Defaults to False.
+    temporary : bool, optional
+        Whether to create a temporary table, dropped at the end of the
+        session, instead of a table in schema. Defaults to False.
 
     Returns
     -------
     None
 
     """
-    if schema:
+    if temporary:
+        schema_name = 'pg_temp'
+    elif schema:
         schema_name = schema.__name__
     else:
         schema_name = 'public'
     qualified_name = schema_name + "." + table_name
 
     q = db_to_query(query)
+    if pk and not view:
+        q = q.add_columns(func.row_number().over().label(pk))
 
     # Create new table from results of the query.
-    with db.session() as sess:
-        sess.execute(CreateTableAs(qualified_name, q, view))
-        if pk:
-            sess.execute("""
-                ALTER TABLE {} ADD COLUMN {} serial PRIMARY KEY;
-            """.format(qualified_name, pk))
+    statement = CreateTableAs(qualified_name, q, view, unlogged=unlogged,
+                              temporary=temporary)
+    compiled = statement.compile(dialect=db._engine.dialect)
+    with db.cursor() as cur:
+        cur.execute(str(compiled), compiled.params)
+        if not view:
+            if pk:
+                sequence = "{}_{}_seq".format(qualified_name, pk)
+                cur.execute("""
+                    ALTER TABLE {table} ADD PRIMARY KEY ({pk});
+                    CREATE {temporary}SEQUENCE {sequence}
+                        OWNED BY {table}.{pk};
+                    SELECT setval('{sequence}',
+                        (SELECT coalesce(max({pk}), 0) + 1 FROM {table}),
+                        false);
+                    ALTER TABLE {table}
+                        ALTER COLUMN {pk} SET DEFAULT nextval('{sequence}');
+                """.format(table=qualified_name, pk=pk, sequence=sequence,
+                           temporary='TEMPORARY ' if temporary else ''))
+            cur.execute("""
+                SELECT attname FROM pg_attribute
+                WHERE attrelid = %s::regclass
+                    AND atttypid = 'geometry'::regtype
+                    AND attnum > 0 AND NOT attisdropped;
+            """, (qualified_name,))
+            for (column,) in cur.fetchall():
+                _create_spatial_index(cur, qualified_name,
+                                      column='"{}"'.format(column))
+            cur.execute("ANALYZE {};".format(qualified_name))
     db.refresh()
 
 
-def db_to_df(query, index_col=None):
+def db_to_df(query, index_col=None, arrow=False):
     """
     Return DataFrame from Query, table, or ORM objects, like columns.
 
+    If arrow, query results are copied in binary format and decoded into
+    columns by db_to_arrow, then converted to pandas, instead of building
+    a Python object for each row. Geometry is then returned as WKB.
+
     Parameters
     ----------
     query : sqlalchemy.orm.Query, sqlalchemy.ext.declarative.DeclarativeMeta,
@@ -732,12 +2677,21 @@ def db_to_df(query, index_col=None):
     index_col : str, optional
         Name of column to use as DataFrame index. If provided, column
         must be contained in query.
+    arrow : bool, optional
+        Whether to transfer data in columnar format. Requires pyarrow.
+        Defaults to False.
 
     Returns
     -------
     df : pandas.DataFrame
 
     """
+    if arrow:
+        df = db_to_arrow(query).to_pandas()
+        if index_col:
+            df.set_index(index_col, inplace=True)
+        return df
+
     q = db_to_query(query)
 
     # Get list of column names.
@@ -761,10 +2715,295 @@ def db_to_df(query, index_col=None):
     return df
 
 
-def df_to_db(df, table_name, schema=None, pk='id'):
+def db_to_arrow(query, batch_size=65536):
+    """
+    Return Arrow table from Query, table, or ORM objects, like columns.
+
+    Query results are copied in binary COPY format and decoded directly
+    into Arrow columns, without creating Python objects for each value.
+    The COPY stream is decoded into record batches as it is received, so
+    only one batch of binary data is held in memory at a time.
+    Geometry columns are returned as WKB, numeric columns as double
+    precision, and columns of other types without a binary decoder as
+    text.
+
+    Requires pyarrow.
+
+    Parameters
+    ----------
+    query : sqlalchemy.orm.Query, sqlalchemy.ext.declarative.DeclarativeMeta,
+            or iterable
+        Query ORM object, table ORM class, or list of ORM objects to query,
+        like columns.
+    batch_size : int, optional
+        Number of rows per record batch. Default is 65536.
+
+    Returns
+    -------
+    table : pyarrow.Table
+
+    """
+    (sql, params) = _query_sql(db_to_query(query))
+
+    with db.cursor() as cur:
+        columns = _describe_query(cur.connection, sql, params)
+        select_list = []
+        type_names = []
+        for (name, type_name) in columns:
+            if type_name == 'geometry':
+                (expression, type_name) = ('ST_AsBinary("{0}")', 'bytea')
+            elif type_name == 'numeric':
+                (expression, type_name) = ('"{0}"::float8', 'float8')
+            elif (type_name in pgcopy.FIXED_DTYPES or
+                  type_name in pgcopy.TEXT_TYPES + pgcopy.BINARY_TYPES):
+                expression = '"{0}"'
+            else:
+                (expression, type_name) = ('"{0}"::text', 'text')
+            select_list.append((expression + ' AS "{0}"').format(name))
+            type_names.append(type_name)
+
+        codec = psycopg2.extensions.encodings[cur.connection.encoding]
+        writer = pgcopy.ArrowCopyWriter([name for (name, type_name)
+                                         in columns],
+                                        type_names, encoding=codec,
+                                        batch_size=batch_size)
+        cur.copy_expert(cur.mogrify("""
+            COPY (SELECT {} FROM ({}) AS q) TO STDOUT WITH (FORMAT binary);
+        """.format(", ".join(select_list), sql), params), writer)
+
+    return writer.table()
+
+
+def arrow_to_db(table, table_name, schema=None, pk='id'):
+    """
+    Create a table from an Arrow table.
+
+    Columns are encoded directly into binary COPY format by
+    pgcopy.from_arrow, without creating Python objects for each value.
+
+    Requires pyarrow.
+
+    Parameters
+    ----------
+    table : pyarrow.Table
+    table_name : str
+        Name of table to create. An existing table is replaced.
+    schema : schema class, optional
+        Schema of table to create. Defaults to public.
+    pk : str, optional
+        Name of serial primary key column to add, or None.
+        Defaults to 'id'.
+
+    Returns
+    -------
+    None
+
+    """
+    if schema:
+        qualified_name = "{}.{}".format(schema.__name__, table_name)
+    else:
+        qualified_name = table_name
+    columns = ['"{}"'.format(name.lower()) for name in table.column_names]
+
+    with db.cursor() as cur:
+        codec = psycopg2.extensions.encodings[cur.connection.encoding]
+        (type_names, data) = pgcopy.from_arrow(table, encoding=codec)
+        cur.execute("DROP TABLE IF EXISTS {};".format(qualified_name))
+        cur.execute("CREATE TABLE {} ({});".format(
+            qualified_name, ", ".join(
+                "{} {}".format(column, type_name)
+                for (column, type_name) in zip(columns, type_names))))
+        cur.copy_expert("COPY {} ({}) FROM STDIN WITH (FORMAT binary);"
+                        .format(qualified_name, ", ".join(columns)),
+                        BytesIO(data))
+        if pk:
+            cur.execute("""
+                ALTER TABLE {} ADD COLUMN {} serial PRIMARY KEY;
+            """.format(qualified_name, pk))
+    db.refresh()
+
+
+def db_to_parquet(query, path, row_group_size=65536, compression='snappy'):
+    """
+    Write results of Query, table, or ORM objects to a Parquet file.
+
+    Rows are fetched from a server-side cursor, row_group_size rows at a
+    time, and each batch is written as a Parquet row group as it arrives,
+    so memory use is constant regardless of the number of rows.
+    Geometry columns are written as WKB, with GeoParquet metadata
+    recording the CRS of each geometry column.
+
+    Requires pyarrow.
+
+    Parameters
+    ----------
+    query : sqlalchemy.orm.Query, sqlalchemy.ext.declarative.DeclarativeMeta,
+            or iterable
+        Query ORM object, table ORM class, or list of ORM objects to query,
+        like columns.
+    path : str
+        Path of Parquet file to write.
+    row_group_size : int, optional
+        Number of rows per row group. Defaults to 65536.
+    compression : str, optional
+        Parquet compression codec. Defaults to 'snappy'.
+
+    Returns
+    -------
+    rows : int
+        Number of rows written.
+
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    (sql, params) = _query_sql(db_to_query(query))
+
+    with db.connection() as conn:
+        columns = _describe_query(conn, sql, params)
+        select_list = []
+        fields = []
+        geo_columns = {}
+        for (name, type_name) in columns:
+            if type_name == 'geometry':
+                select_list.append('ST_AsBinary("{0}") AS "{0}"'.format(name))
+                geo_columns[name] = {
+                    'encoding': 'WKB',
+                    'geometry_types': [],
+                    'crs': _projjson(conn, _query_srid(conn, sql, params,
+                                                       name)),
+                }
+            else:
+                select_list.append('"{}"'.format(name))
+            fields.append(pa.field(name, _arrow_type(type_name)))
+
+        schema = pa.schema(fields)
+        if geo_columns:
+            geo = {
+                'version': '1.0.0',
+                'primary_column': [name for (name, type_name) in columns
+                                   if name in geo_columns][0],
+                'columns': geo_columns,
+            }
+            schema = schema.with_metadata({b'geo': json.dumps(geo)})
+
+        rows = 0
+        writer = pq.ParquetWriter(path, schema, compression=compression)
+        try:
+            with conn.cursor(name='spandex_db_to_parquet') as cur:
+                cur.itersize = row_group_size
+                cur.execute("SELECT {} FROM ({}) AS q;".format(
+                    ", ".join(select_list), sql), params)
+                while True:
+                    records = cur.fetchmany(row_group_size)
+                    if not records:
+                        break
+                    arrays = [pa.array([_arrow_value(value)
+                                        for value in values],
+                                       type=field.type)
+                              for (values, field)
+                              in zip(zip(*records), fields)]
+                    writer.write_table(
+                        pa.Table.from_arrays(arrays, schema=schema))
+                    rows += len(records)
+                    logger.debug("Wrote %s rows to %s." % (rows, path))
+        finally:
+            writer.close()
+    return rows
+
+
+def _query_sql(q):
+    """Compile a Query into a (SQL string, parameters) tuple for psycopg2."""
+    compiled = q.statement.compile(dialect=db._engine.dialect)
+    return (str(compiled), compiled.params)
+
+
+def _describe_query(conn, sql, params):
+    """Return list of (column name, type name) tuples of a query result."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT * FROM ({}) AS q LIMIT 0;".format(sql), params)
+        oids = [column[1] for column in cur.description]
+        names = [column[0] for column in cur.description]
+        cur.execute("SELECT oid, typname FROM pg_type WHERE oid = ANY(%s);",
+                    (oids,))
+        type_names = dict(cur.fetchall())
+    return [(name, type_names[oid]) for (name, oid) in zip(names, oids)]
+
+
+def _query_srid(conn, sql, params, column):
+    """Return SRID of the first non-null geometry in a query column."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT ST_SRID("{column}") FROM ({sql}) AS q
+            WHERE "{column}" IS NOT NULL LIMIT 1;
+        """.format(column=column, sql=sql), params)
+        row = cur.fetchone()
+    return row[0] if row else 0
+
+
+def _projjson(conn, srid):
+    """Return PROJJSON definition of an SRID, or None if unavailable."""
+    if not srid or not gdal:
+        return None
+    with conn.cursor() as cur:
+        cur.execute("SELECT srtext FROM spatial_ref_sys WHERE srid = %s;",
+                    (srid,))
+        row = cur.fetchone()
+    sr = osr.SpatialReference()
+    if not row or sr.ImportFromWkt(row[0]) != 0 or \
+            not hasattr(sr, 'ExportToPROJJSON'):
+        return None
+    return json.loads(sr.ExportToPROJJSON())
+
+
+def _arrow_type(type_name):
+    """Return Arrow type for a PostgreSQL type name, defaulting to string."""
+    import pyarrow as pa
+
+    return {
+        'bool': pa.bool_(),
+        'int2': pa.int16(),
+        'int4': pa.int32(),
+        'int8': pa.int64(),
+        'float4': pa.float32(),
+        'float8': pa.float64(),
+        'numeric': pa.float64(),
+        'date': pa.date32(),
+        'timestamp': pa.timestamp('us'),
+        'timestamptz': pa.timestamp('us', tz='UTC'),
+        'bytea': pa.binary(),
+        'geometry': pa.binary(),
+    }.get(type_name, pa.string())
+
+
+def _arrow_value(value):
+    """Convert a psycopg2 value to a Python value accepted by Arrow."""
+    if value is None or isinstance(value, integer_types + string_types +
+                                   (float, datetime.date)):
+        return value
+    elif isinstance(value, (memoryview, bytearray)):
+        return bytes(value)
+    elif isinstance(value, decimal.Decimal):
+        return float(value)
+    elif isinstance(value, (dict, list)):
+        # json and jsonb.
+        return json.dumps(value)
+    return str(value)
+
+
+def df_to_db(df, table_name, schema=None, pk='id', arrow=False):
     # Does not sanitize DataFrame input. Will fail if values contain
     # the escape character, backslash (\). Binary format COPY would be
-    # faster and might be more robust.
+    # faster and might be more robust: if arrow, the DataFrame is
+    # converted to an Arrow table and copied in binary format instead.
+    if arrow:
+        import pyarrow as pa
+
+        df = df.reset_index()
+        df.columns = [s.lower() for s in df.columns]
+        arrow_to_db(pa.Table.from_pandas(df, preserve_index=False),
+                    table_name, schema=schema, pk=pk)
+        return
     if schema:
         schema_name = schema.__name__
         qualified_name = "{}.{}".format(schema_name, table_name)
@@ -790,56 +3029,556 @@ def df_to_db(df, table_name, schema=None, pk='id'):
     db.refresh()
 
 
-def dbf_to_df(path):
+def update_from_df(df, table, key, columns=None, upsert=False):
+    """
+    Update or upsert rows of an existing table from a DataFrame.
+
+    The DataFrame is streamed with COPY into a temporary staging table
+    with the same column types as the target table. A single set-based
+    ``UPDATE ... FROM`` (or ``INSERT ... ON CONFLICT`` if upserting) then
+    applies all rows at once, all in one transaction, on commit of which
+    the staging table is dropped. Being temporary, the staging table is
+    private to the connection, so concurrent calls do not collide.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        DataFrame containing new values. Key values are taken from the
+        index if it is named key, otherwise from the key column.
+    table : sqlalchemy.ext.declarative.DeclarativeMeta
+        Table ORM class to update.
+    key : str
+        Name of column identifying rows in both df and table. When
+        upserting, key must have a unique index or constraint.
+    columns : iterable of str, optional
+        Names of columns to update. Defaults to all DataFrame columns
+        other than key.
+    upsert : bool, optional
+        Whether to insert rows with key values that do not exist in the
+        table, instead of ignoring them. Defaults to False.
+
+    Returns
+    -------
+    rowcount : int
+        Number of rows updated or inserted.
+
+    """
+    if df.index.name == key:
+        df = df.reset_index()
+    if columns is None:
+        columns = [c for c in df.columns if c != key]
+    else:
+        columns = list(columns)
+    if not columns:
+        raise ValueError("No columns to update.")
+
+    t = table.__table__
+    qualified_name = "{}.{}".format(t.schema, t.name)
+    staging_name = '"_{}_staging"'.format(t.name)
+    all_columns = [key] + columns
+    column_list = ", ".join(all_columns)
+
+    buf = cStringIO()
+    df[all_columns].to_csv(buf, na_rep=r'\N', header=False, index=False)
+    buf.seek(0)
+
+    with db.cursor() as cur:
+        # Staging table inherits the target column types, but no data.
+        cur.execute("""
+            CREATE TEMPORARY TABLE {staging} ON COMMIT DROP AS
+                SELECT {columns} FROM {table} WITH NO DATA;
+        """.format(staging=staging_name, table=qualified_name,
+                   columns=column_list))
+        cur.copy_expert("""
+            COPY {staging} ({columns}) FROM STDIN
+            WITH (FORMAT csv, NULL '\\N');
+        """.format(staging=staging_name, columns=column_list), buf)
+
+        if upsert:
+            cur.execute("""
+                INSERT INTO {table} ({columns})
+                    SELECT {columns} FROM {staging}
+                ON CONFLICT ({key}) DO UPDATE SET {assignments};
+            """.format(
+                table=qualified_name, staging=staging_name,
+                columns=column_list, key=key,
+                assignments=", ".join("{0} = EXCLUDED.{0}".format(c)
+                                      for c in columns)))
+        else:
+            cur.execute("""
+                UPDATE {table} AS t SET {assignments}
+                FROM {staging} AS s
+                WHERE t.{key} = s.{key};
+            """.format(
+                table=qualified_name, staging=staging_name, key=key,
+                assignments=", ".join("{0} = s.{0}".format(c)
+                                      for c in columns)))
+        rowcount = cur.rowcount
+
+    logger.debug("Updated %s rows of %s from DataFrame."
+                 % (rowcount, qualified_name))
+    return rowcount
+
+
+def _open_ogr(filepath, encoding=None):
+    """Open a vector data source with OGR, returning a GDAL dataset."""
+    from osgeo import gdal
+
+    # Shapefile driver recodes attributes from encoding into UTF-8.
+    open_options = []
+    if encoding:
+        open_options.append('ENCODING=' + encoding)
+    dataset = gdal.OpenEx(filepath, gdal.OF_VECTOR,
+                          open_options=open_options)
+    if dataset is None:
+        raise IOError("Unable to open vector data source: %s" % filepath)
+    return dataset
+
+
+def _get_ogr_layer(dataset, layer, filepath):
+    """Return OGR layer by name or index, defaulting to the first layer."""
+    ogr_layer = dataset.GetLayer(0 if layer is None else layer)
+    if ogr_layer is None:
+        raise ValueError("No layer %s in %s" % (layer, filepath))
+    return ogr_layer
+
+
+def _ogr_geometry_type(layer, promote_multi=False):
+    """Return PostGIS geometry type name of an OGR layer."""
+    from osgeo import ogr
+
+    geom_type = layer.GetGeomType()
+    flat_type = ogr.GT_Flatten(geom_type)
+    if promote_multi:
+        if flat_type == ogr.wkbPolygon:
+            flat_type = ogr.wkbMultiPolygon
+        elif flat_type == ogr.wkbLineString:
+            flat_type = ogr.wkbMultiLineString
+    type_name = {
+        ogr.wkbPoint: 'POINT',
+        ogr.wkbLineString: 'LINESTRING',
+        ogr.wkbPolygon: 'POLYGON',
+        ogr.wkbMultiPoint: 'MULTIPOINT',
+        ogr.wkbMultiLineString: 'MULTILINESTRING',
+        ogr.wkbMultiPolygon: 'MULTIPOLYGON',
+        ogr.wkbGeometryCollection: 'GEOMETRYCOLLECTION',
+    }.get(flat_type, 'GEOMETRY')
+    if ogr.GT_HasZ(geom_type) and type_name != 'GEOMETRY':
+        type_name += 'Z'
+    return type_name
+
+
+def _ogr_fields(layer):
+    """
+    Return list of (column name, PostgreSQL type, getter) tuples for the
+    attribute fields of an OGR layer.
+
+    Each getter takes an OGR feature and returns a Python value or None.
+
+    """
+    from osgeo import ogr
+
+    def getter(i, get):
+        def get_field(feature):
+            if not feature.IsFieldSet(i):
+                return None
+            if hasattr(feature, 'IsFieldNull') and feature.IsFieldNull(i):
+                return None
+            return get(feature, i)
+        return get_field
+
+    def get_string(feature, i):
+        value = feature.GetFieldAsString(i)
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        return value
+
+    def get_date(feature, i):
+        (year, month, day) = feature.GetFieldAsDateTime(i)[:3]
+        if year == 0:
+            return None
+        return datetime.date(year, month, day)
+
+    def get_datetime(feature, i):
+        (year, month, day, hour, minute, second) = \
+            feature.GetFieldAsDateTime(i)[:6]
+        if year == 0:
+            return None
+        return datetime.datetime(year, month, day, hour, minute,
+                                 int(second), int(second % 1 * 1000000))
+
+    defn = layer.GetLayerDefn()
+    fields = []
+    for i in range(defn.GetFieldCount()):
+        field_defn = defn.GetFieldDefn(i)
+        name = field_defn.GetName().lower()
+        if name in ('gid', 'geom'):
+            # Avoid conflict with reserved column names, like shp2pgsql.
+            name = '__' + name
+        field_type = field_defn.GetType()
+        width = field_defn.GetWidth()
+        if field_type == ogr.OFTInteger:
+            fields.append((name, 'integer',
+                           getter(i, ogr.Feature.GetFieldAsInteger)))
+        elif field_type == getattr(ogr, 'OFTInteger64', None):
+            fields.append((name, 'bigint',
+                           getter(i, ogr.Feature.GetFieldAsInteger64)))
+        elif field_type == ogr.OFTReal:
+            fields.append((name, 'double precision',
+                           getter(i, ogr.Feature.GetFieldAsDouble)))
+        elif field_type == ogr.OFTDate:
+            fields.append((name, 'date', getter(i, get_date)))
+        elif field_type == ogr.OFTDateTime:
+            fields.append((name, 'timestamp', getter(i, get_datetime)))
+        elif field_type == ogr.OFTString and width > 0:
+            fields.append((name, 'varchar({})'.format(width),
+                           getter(i, get_string)))
+        else:
+            fields.append((name, 'text', getter(i, get_string)))
+    return fields
+
+
+def _ogr_features(layer, start=0, count=None):
+    """Generate up to count features of an OGR layer, from index start."""
+    if start:
+        layer.SetNextByIndex(start)
+    else:
+        layer.ResetReading()
+    n = 0
+    while count is None or n < count:
+        feature = layer.GetNextFeature()
+        if feature is None:
+            break
+        n += 1
+        yield feature
+
+
+def _ogr_rows(features, fields, srid, promote_multi=False, transform=None):
+    """Generate tuples of attribute values and EWKB geometry."""
+    from osgeo import ogr
+
+    getters = [get for (name, type_name, get) in fields]
+    for feature in features:
+        geom = feature.GetGeometryRef()
+        if geom is None:
+            wkb = None
+        else:
+            if transform:
+                geom.Transform(transform)
+            if promote_multi:
+                flat_type = ogr.GT_Flatten(geom.GetGeometryType())
+                if flat_type == ogr.wkbPolygon:
+                    geom = ogr.ForceToMultiPolygon(geom)
+                elif flat_type == ogr.wkbLineString:
+                    geom = ogr.ForceToMultiLineString(geom)
+            wkb = pgcopy.ewkb(geom.ExportToWkb(ogr.wkbNDR), srid)
+        yield tuple(get(feature) for get in getters) + (wkb,)
+
+
+def _load_ogr(cur, filepath, table, srid, encoding=None, layer=None,
+              append=False, promote_multi=False, index=True, unlogged=False,
+              target_srid=None, chunk_size=None, start=0, on_chunk=None):
+    """
+    Load an OGR layer into a PostGIS table with binary COPY.
+
+    Unless appending, the table is created with a gid serial primary key,
+    a column for each attribute field, and a geom column, with a GIST
+    index if index is True. The table is UNLOGGED if unlogged is True.
+
+    If target_srid is specified, geometries are reprojected from srid into
+    target_srid as they are streamed, using the spatial_ref_sys definitions
+    of both SRIDs.
+
+    If chunk_size is specified, features are copied in chunks of up to
+    chunk_size features, starting from feature index start. After each
+    chunk, on_chunk is called with the index of the next feature to load,
+    for example to record progress and commit. The load rate is logged
+    after each chunk.
+
+    Returns
+    -------
+    rowcount : int
+        Number of features loaded.
+
+    """
+    dataset = _open_ogr(filepath, encoding)
+    ogr_layer = _get_ogr_layer(dataset, layer, filepath)
+
+    fields = _ogr_fields(ogr_layer)
+    geom_type = _ogr_geometry_type(ogr_layer, promote_multi)
+
+    if target_srid:
+        transform = osr.CoordinateTransformation(_db_srs(cur, srid),
+                                                 _db_srs(cur, target_srid))
+        srid = target_srid
+    else:
+        transform = None
+
+    if not append:
+        column_defs = ['gid serial PRIMARY KEY']
+        column_defs += ['"{}" {}'.format(name, type_name)
+                        for (name, type_name, get) in fields]
+        column_defs.append('geom geometry({}, {})'.format(geom_type, srid))
+        cur.execute("CREATE {unlogged}TABLE {table} ({columns});".format(
+            unlogged="UNLOGGED " if unlogged else "",
+            table=table, columns=", ".join(column_defs)))
+        if index:
+            _create_spatial_index(cur, table)
+
+    # Character types must be encoded in the connection client encoding.
+    codec = psycopg2.extensions.encodings[cur.connection.encoding]
+    encoders = [pgcopy.get_encoder(type_name, codec)
+                for (name, type_name, get) in fields]
+    encoders.append(pgcopy.get_encoder('geometry'))
+    column_names = ['"{}"'.format(name) for (name, type_name, get) in fields]
+    column_names.append('geom')
+
+    copy_sql = "COPY {table} ({columns}) FROM STDIN WITH (FORMAT binary);"
+    copy_sql = copy_sql.format(table=table, columns=", ".join(column_names))
+
+    offset = start
+    start_time = time.time()
+    while True:
+        features = _ogr_features(ogr_layer, offset, chunk_size)
+        rows = _ogr_rows(features, fields, srid, promote_multi, transform)
+        copy_file = pgcopy.BinaryCopyFile(rows, encoders)
+        cur.copy_expert(copy_sql, copy_file)
+        offset += copy_file.rowcount
+        if on_chunk:
+            on_chunk(offset)
+
+        elapsed = time.time() - start_time
+        logger.info("Loaded %s features into %s (%.0f rows/sec)."
+                    % (offset, table, (offset - start) / max(elapsed, 1e-3)))
+        if not chunk_size or copy_file.rowcount < chunk_size:
+            break
+    return offset - start
+
+
+class _Fingerprint(object):
+    """Fingerprint of a shapefile and its sidecar files.
+
+    Size is the total size and mtime is the latest modification time of
+    all files. The SHA-1 content hash is only computed when accessed.
+
+    """
+    extensions = ['.shx', '.dbf', '.prj', '.cpg', '.cst']
+
+    def __init__(self, path):
+        self.path = path
+        root = os.path.splitext(path)[0]
+        self.paths = [path]
+        for ext in self.extensions:
+            for sidecar in (root + ext, root + ext.upper()):
+                if os.path.exists(sidecar):
+                    self.paths.append(sidecar)
+                    break
+        stats = [os.stat(p) for p in self.paths]
+        self.size = sum(stat.st_size for stat in stats)
+        self.mtime = max(stat.st_mtime for stat in stats)
+        self._content_hash = None
+
+    @property
+    def content_hash(self):
+        if self._content_hash is None:
+            sha1 = hashlib.sha1()
+            for p in self.paths:
+                with open(p, 'rb') as f:
+                    for block in iter(lambda: f.read(1 << 20), b''):
+                        sha1.update(block)
+            self._content_hash = sha1.hexdigest()
+        return self._content_hash
+
+
+def _normalize_wkt(wkt):
+    """Normalize WKT projection for comparison, ignoring whitespace/case."""
+    return re.sub(r'\s+', '', wkt).upper()
+
+
+def _normalize_proj4(proj4):
+    """Normalize PROJ.4 definition for comparison.
+
+    Parameters are sorted, numeric values are rounded to 10 significant
+    digits, and parameters without effect on the projection are dropped.
+
+    """
+    params = []
+    for param in proj4.split():
+        if param in ('+no_defs', '+wktext', '+type=crs'):
+            continue
+        if '=' in param:
+            (key, value) = param.split('=', 1)
+            try:
+                value = '%.10g' % float(value)
+            except ValueError:
+                pass
+            param = key + '=' + value
+        params.append(param)
+    return ' '.join(sorted(params))
+
+
+def _db_srs(cur, srid):
+    """Return OSR spatial reference for a SRID defined in spatial_ref_sys."""
+    cur.execute("SELECT proj4text FROM spatial_ref_sys WHERE srid = %s;",
+                (srid,))
+    row = cur.fetchone()
+    if not row:
+        raise ValueError("SRID not in spatial_ref_sys: %s" % srid)
+    sr = osr.SpatialReference()
+    sr.ImportFromProj4(row[0])
+    if hasattr(sr, 'SetAxisMappingStrategy'):
+        # GDAL 3+ otherwise follows the authority axis order.
+        sr.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    return sr
+
+
+def _create_spatial_index(cur, table, maintenance_work_mem=None,
+                          column='geom'):
+    """Create GIST index on a geometry column, like shp2pgsql -I."""
+    if maintenance_work_mem:
+        # Only for the remainder of the current transaction.
+        cur.execute("SET LOCAL maintenance_work_mem = %s;",
+                    (maintenance_work_mem,))
+    cur.execute("CREATE INDEX ON {table} USING GIST ({column});".format(
+        table=table, column=column))
+
+
+def dbf_to_df(path, usecols=None, encoding=None):
     """
     Return DataFrame from attributes stored in dBase/xBase format.
 
-    Uses OGR's ESRI Shapefile driver to read records from the file.
+    The file is memory-mapped and each column is decoded in bulk with
+    NumPy, rather than record by record. Numeric columns without decimals
+    are returned as integers (Python integers if too large for int64)
+    unless they contain blanks, which are returned as NaN. Date columns
+    are returned as datetimes and logical columns as booleans (or None if
+    uninitialized).
 
     Parameters
     ----------
     path : str
         File path to the dBase/xBase file.
+    usecols : list of str, optional
+        Names of columns to read. Defaults to all columns.
+    encoding : str, optional
+        Character encoding of the attributes. Defaults to the encoding
+        specified by a cpg file next to the dBase/xBase file, or LATIN1.
 
     Returns
     -------
     df : pandas.DataFrame
 
     """
-    import ogr
-
-    # Open the file and collect information on fields.
-    dbf = ogr.Open(path)
-    table = dbf.GetLayer()
-    header = table.GetLayerDefn()
-    ncolumns = header.GetFieldCount()
-    column_names = [header.GetFieldDefn(i).GetName() for i in range(ncolumns)]
-    column_types = [header.GetFieldDefn(i).GetType() for i in range(ncolumns)]
-
-    def read(row, i):
-        """Return i-th field of a record."""
-        # For performance, use the appropriate field type function.
-        fld_type = column_types[i]
-        if fld_type == ogr.OFTInteger:
-            return row.GetFieldAsInteger(i)
-        elif fld_type == ogr.OFTReal:
-            return row.GetFieldAsDouble(i)
-        elif fld_type == ogr.OFTStringList:
-            return row.GetFieldAsStringList(i)
-        elif fld_type == ogr.OFTIntegerList:
-            return row.GetFieldAsIntegerList(i)
-        elif fld_type == ogr.OFTRealList:
-            return row.GetFieldAsDoubleList(i)
-        else:
-            return row.GetFieldAsString(i)
+    if encoding is None:
+        encoding = _cpg_encoding(path) or 'LATIN1'
+    codec = _python_codec(encoding)
+
+    # Parse the fixed-width header: record count, header length, and
+    # record length, followed by 32-byte field descriptors terminated by
+    # a carriage return.
+    with open(path, 'rb') as f:
+        (nrecords, header_length, record_length) = struct.unpack(
+            '<xxxxIHH', f.read(12))
+        f.seek(32)
+        descriptors = f.read(header_length - 32)
+    fields = []
+    offset = 1  # Skip deletion flag.
+    for i in range(0, len(descriptors) - 31, 32):
+        descriptor = descriptors[i:i + 32]
+        if descriptor[:1] == b'\r':
+            break
+        name = descriptor[:11].split(b'\x00')[0].decode(codec).strip()
+        (field_type, length, decimals) = struct.unpack(
+            '<c4xBB', descriptor[11:18])
+        fields.append((name, field_type.decode('ascii').upper(), offset,
+                       length, decimals))
+        offset += length
+
+    if usecols is not None:
+        missing = set(usecols) - set(field[0] for field in fields)
+        if missing:
+            raise ValueError("Columns not found in %s: %s"
+                             % (path, ', '.join(sorted(missing))))
+        fields = [field for field in fields if field[0] in usecols]
+
+    # Map records as a structured array of fixed-width byte strings.
+    dtype = np.dtype({
+        'names': ['_deleted'] + ['f%s' % i for i in range(len(fields))],
+        'formats': ['S1'] + ['S%s' % field[3] for field in fields],
+        'offsets': [0] + [field[2] for field in fields],
+        'itemsize': record_length,
+    })
+    if nrecords:
+        records = np.memmap(path, dtype=dtype, mode='r',
+                            offset=header_length, shape=(nrecords,))
+        records = records[records['_deleted'] != b'*']
+    else:
+        records = np.zeros(0, dtype=dtype)
+
+    columns = []
+    for (i, (name, field_type, offset, length, decimals)) in \
+            enumerate(fields):
+        values = np.char.strip(records['f%s' % i])
+        columns.append(_decode_dbf_column(values, field_type, decimals,
+                                          codec))
+    keys = ['f%s' % i for i in range(len(fields))]
+    df = pd.DataFrame(dict(zip(keys, columns)), columns=keys)
+    df.columns = [field[0] for field in fields]
+    return df
 
-    # Represent records with memory-efficient generators.
-    values = lambda row: (read(row, i) for i in range(ncolumns))
-    records = (values(row) for row in table)
 
-    df = pd.DataFrame.from_records(records, columns=column_names,
-                                   coerce_float=False)
-    return df
+def _decode_dbf_column(values, field_type, decimals, codec):
+    """Decode array of stripped dBase field values by field type."""
+    if field_type in ('N', 'F'):
+        # Blank and overflowed (asterisk-filled) values are null.
+        null = (values == b'') | (np.char.count(values, b'*') > 0)
+        if field_type == 'N' and decimals == 0 and not null.any():
+            # Parse integers directly, since float64 cannot represent all
+            # integers above 2 ** 53, like large IDs.
+            try:
+                return values.astype(np.int64)
+            except OverflowError:
+                # Wider than int64, so keep exact Python integers.
+                return np.array([int(v) for v in values], dtype=object)
+            except ValueError:
+                # Not integers after all, like "1." or "1e3".
+                pass
+        return np.where(null, b'nan', values).astype(np.float64)
+    elif field_type == 'D':
+        return pd.to_datetime(np.char.decode(values, 'ascii'),
+                              format='%Y%m%d', errors='coerce')
+    elif field_type == 'L':
+        column = np.full(len(values), None, dtype=object)
+        first = np.char.upper(values.astype('S1'))
+        column[np.isin(first, [b'Y', b'T'])] = True
+        column[np.isin(first, [b'N', b'F'])] = False
+        return column
+    else:
+        return np.char.decode(values, codec).astype(object)
+
+
+def _cpg_encoding(path):
+    """Return encoding specified by cpg file next to a file, or None."""
+    for extension in ['.cpg', '.CPG']:
+        try:
+            with open(os.path.splitext(path)[0] + extension) as f:
+                encoding = f.read().strip()
+        except IOError:
+            continue
+        if encoding and encoding.lower() != 'system':
+            return encoding
+
+
+def _python_codec(encoding):
+    """Return Python codec name for a shapefile or PostgreSQL encoding."""
+    if encoding.isdigit():
+        # Windows and ANSI code pages, like 1252.
+        encoding = 'cp' + encoding
+    try:
+        return codecs.lookup(encoding).name
+    except LookupError:
+        logger.warn("Unknown encoding %s. Assuming LATIN1." % encoding)
+        return 'latin1'
 
 
 def vacuum(table):
@@ -871,3 +3610,91 @@ def vacuum(table):
                     schema=t.schema, table=t.name))
         finally:
             conn.autocommit = False
+
+
+def vacuum_many(tables, workers=1, analyze_only=False):
+    """
+    VACUUM and then ANALYZE many tables concurrently.
+
+    Tables are processed most bloated first, by number of dead tuples in
+    pg_stat_user_tables, each on a dedicated autocommit connection, so
+    that the tables that benefit most are done first.
+
+    The number of dead tuples reclaimed is taken from the VACUUM VERBOSE
+    report of each table, as the statistics are updated asynchronously
+    and may not reflect the VACUUM yet when it returns.
+
+    Parameters
+    ----------
+    tables : list of sqlalchemy.ext.declarative.DeclarativeMeta or str
+        Table ORM classes or names (optionally schema-qualified).
+    workers : int, optional
+        Number of tables to process concurrently. Defaults to 1.
+    analyze_only : bool, optional
+        Whether to only ANALYZE tables, updating planner statistics
+        without reclaiming storage. Defaults to False.
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        Indexed by table name in processing order, with columns: seconds
+        (time taken), dead_tuples (estimate of dead tuples before, from
+        statistics), and reclaimed (dead tuples removed by VACUUM, or 0
+        if analyze_only).
+
+    """
+    names = [_qualified_name(table) for table in tables]
+    with db.cursor() as cur:
+        dead = dict((name, _dead_tuples(cur, name)) for name in names)
+    names.sort(key=lambda name: dead[name], reverse=True)
+    command = "ANALYZE" if analyze_only else "VACUUM (VERBOSE, ANALYZE)"
+
+    with db.pool(max(workers, 1)) as pool:
+        def vacuum_table(name):
+            conn = pool.getconn()
+            try:
+                conn.autocommit = True
+                del conn.notices[:]
+                with conn.cursor() as cur:
+                    start = time.time()
+                    cur.execute("{} {};".format(command, name))
+                    elapsed = time.time() - start
+                reclaimed = _vacuum_removed(conn.notices)
+                del conn.notices[:]
+            finally:
+                pool.putconn(conn)
+            logger.info("%s %s in %.1f seconds." % (command, name, elapsed))
+            return (elapsed, reclaimed)
+        results = parallel_map(vacuum_table, names, workers)
+
+    df = pd.DataFrame(results, columns=['seconds', 'reclaimed'], index=names)
+    df.insert(1, 'dead_tuples', [dead[name] for name in names])
+    return df
+
+
+def _dead_tuples(cur, table):
+    """Return number of dead tuples in a table, from statistics."""
+    cur.execute("""
+        SELECT coalesce(n_dead_tup, 0) FROM pg_stat_user_tables
+        WHERE relid = %s::regclass;
+    """, (table,))
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+
+def _vacuum_removed(notices):
+    """Return number of dead tuples removed, from VACUUM VERBOSE notices.
+
+    Reports on TOAST tables are ignored. PostgreSQL 15 and later report
+    "tuples: N removed", earlier versions "found N removable".
+
+    """
+    removed = 0
+    for notice in notices:
+        if 'pg_toast' in notice:
+            continue
+        match = re.search(r'found (\d+) removable|tuples: (\d+) removed',
+                          notice)
+        if match:
+            removed += int(match.group(1) or match.group(2))
+    return removed
@@ -0,0 +1,670 @@
+import datetime
+import struct
+
+import numpy as np
+
+
+"""
+Contains encoders and decoders for the PostgreSQL binary COPY format.
+
+Rows of Python values are encoded lazily by BinaryCopyFile. Whole columns
+are converted between binary COPY data and Arrow arrays with NumPy by
+to_arrow and from_arrow, without creating Python objects per value.
+ArrowCopyWriter decodes a COPY stream into Arrow record batches as it is
+received.
+
+"""
+
+
+# Binary COPY file header: signature, flags field, and header extension
+# area length. The trailer is a tuple field count of -1.
+HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('!ii', 0, 0)
+TRAILER = struct.pack('!h', -1)
+
+# Dates and timestamps are sent relative to the PostgreSQL epoch.
+EPOCH_DATE = datetime.date(2000, 1, 1)
+EPOCH_DATETIME = datetime.datetime(2000, 1, 1)
+
+# EWKB flag for geometry with embedded SRID.
+EWKB_SRID_FLAG = 0x20000000
+
+# Offsets of the PostgreSQL epoch from the Unix epoch used by Arrow.
+EPOCH_DAYS = 10957
+EPOCH_MICROSECONDS = EPOCH_DAYS * 86400 * 1000000
+
+# Binary send formats of fixed-width types, by pg_type name, as NumPy
+# dtypes. Dates and timestamps are relative to the PostgreSQL epoch.
+FIXED_DTYPES = {
+    'bool': np.dtype('u1'),
+    'int2': np.dtype('>i2'),
+    'int4': np.dtype('>i4'),
+    'int8': np.dtype('>i8'),
+    'float4': np.dtype('>f4'),
+    'float8': np.dtype('>f8'),
+    'date': np.dtype('>i4'),
+    'timestamp': np.dtype('>i8'),
+    'timestamptz': np.dtype('>i8'),
+}
+
+# Variable-width types whose binary send format is the raw bytes, by
+# pg_type name. Character types are in the connection client encoding.
+TEXT_TYPES = ('text', 'varchar', 'bpchar', 'name')
+BINARY_TYPES = ('bytea',)
+
+
+def _encode_date(value):
+    return struct.pack('!i', (value - EPOCH_DATE).days)
+
+
+def _encode_timestamp(value):
+    delta = value - EPOCH_DATETIME
+    microseconds = ((delta.days * 86400 + delta.seconds) * 1000000 +
+                    delta.microseconds)
+    return struct.pack('!q', microseconds)
+
+
+def _encode_bool(value):
+    return b'\x01' if value else b'\x00'
+
+
+# Encoders for the binary send format of each PostgreSQL type, by type
+# name. Each encoder takes a non-null Python value and returns bytes.
+ENCODERS = {
+    'smallint': lambda value: struct.pack('!h', value),
+    'integer': lambda value: struct.pack('!i', value),
+    'bigint': lambda value: struct.pack('!q', value),
+    'real': lambda value: struct.pack('!f', value),
+    'double precision': lambda value: struct.pack('!d', value),
+    'boolean': _encode_bool,
+    'date': _encode_date,
+    'timestamp': _encode_timestamp,
+    'bytea': bytes,
+    # PostGIS geometry_recv accepts WKB and EWKB.
+    'geometry': bytes,
+}
+
+
+def get_encoder(type_name, encoding='utf-8'):
+    """
+    Return binary COPY encoder for a PostgreSQL type.
+
+    Character types (text, varchar, char) are encoded in the specified
+    Python codec, which must match the client encoding of the connection.
+
+    Parameters
+    ----------
+    type_name : str
+        PostgreSQL type name, optionally with a type modifier, like
+        'varchar(10)' or 'geometry(MultiPolygon, 2768)'.
+    encoding : str, optional
+        Python codec used to encode character types.
+
+    Returns
+    -------
+    encoder : callable
+
+    """
+    base_name = type_name.split('(')[0].strip().lower()
+    if base_name in ('text', 'varchar', 'character varying', 'char',
+                     'character', 'bpchar', 'name'):
+        return lambda value: value.encode(encoding)
+    try:
+        return ENCODERS[base_name]
+    except KeyError:
+        raise ValueError("No binary encoder for type: %s" % type_name)
+
+
+def ewkb(wkb, srid):
+    """
+    Convert WKB geometry to EWKB with an embedded SRID.
+
+    Only the outer geometry is tagged with the SRID, as in PostGIS.
+
+    Parameters
+    ----------
+    wkb : bytes
+        Well-known binary geometry, in either byte order.
+    srid : int
+        Spatial Reference System Identifier (SRID).
+
+    Returns
+    -------
+    ewkb : bytes
+
+    """
+    wkb = bytes(wkb)
+    byte_order = '<' if wkb[:1] == b'\x01' else '>'
+    (wkb_type,) = struct.unpack(byte_order + 'I', wkb[1:5])
+    return (wkb[:1] +
+            struct.pack(byte_order + 'II', wkb_type | EWKB_SRID_FLAG, srid) +
+            wkb[5:])
+
+
+def encode_row(values, encoders):
+    """Encode a tuple of values as a binary COPY tuple."""
+    parts = [struct.pack('!h', len(values))]
+    for (value, encoder) in zip(values, encoders):
+        if value is None:
+            parts.append(struct.pack('!i', -1))
+        else:
+            data = encoder(value)
+            parts.append(struct.pack('!i', len(data)))
+            parts.append(data)
+    return b''.join(parts)
+
+
+class BinaryCopyFile(object):
+    """
+    Read-only file-like object streaming rows in binary COPY format.
+
+    Rows are encoded lazily as the file is read, so arbitrarily large
+    iterables can be passed to psycopg2's copy_expert in constant memory.
+
+    Parameters
+    ----------
+    rows : iterable of tuples
+        Rows of Python values. None is encoded as NULL.
+    encoders : list of callables
+        Encoder for each column, as returned by get_encoder.
+
+    Attributes
+    ----------
+    rowcount : int
+        Number of rows encoded so far.
+
+    """
+    def __init__(self, rows, encoders):
+        self._rows = iter(rows)
+        self._encoders = encoders
+        self._buffer = HEADER
+        self._done = False
+        self.rowcount = 0
+
+    def _fill(self, size):
+        chunks = [self._buffer]
+        length = len(self._buffer)
+        while not self._done and (size < 0 or length < size):
+            try:
+                row = next(self._rows)
+            except StopIteration:
+                chunks.append(TRAILER)
+                self._done = True
+                break
+            chunk = encode_row(row, self._encoders)
+            self.rowcount += 1
+            chunks.append(chunk)
+            length += len(chunk)
+        self._buffer = b''.join(chunks)
+
+    def read(self, size=-1):
+        self._fill(size)
+        if size < 0:
+            (data, self._buffer) = (self._buffer, b'')
+        else:
+            (data, self._buffer) = (self._buffer[:size], self._buffer[size:])
+        return data
+
+
+def _ranges(starts, lengths):
+    """Return concatenated indexes of byte ranges, without a Python loop."""
+    total = int(lengths.sum())
+    offsets = np.cumsum(lengths) - lengths
+    return (np.repeat(starts - offsets, lengths) +
+            np.arange(total, dtype=np.int64))
+
+
+def _validity(mask):
+    """Return Arrow validity bitmap buffer for a boolean null mask."""
+    import pyarrow as pa
+
+    return pa.py_buffer(np.packbits(~mask, bitorder='little'))
+
+
+def _body_start(data):
+    """Return offset of the first tuple of binary COPY data."""
+    if data[:len(HEADER) - 8] != HEADER[:-8]:
+        raise ValueError("Invalid binary COPY signature.")
+    (extension_length,) = struct.unpack_from('!i', data, len(HEADER) - 4)
+    return len(HEADER) + extension_length
+
+
+def _int32(buf, positions):
+    """Return big-endian 32-bit integers at positions of a byte array."""
+    values = buf[positions[:, np.newaxis] + np.arange(4)]
+    return values.view('>i4').ravel().astype(np.int64)
+
+
+def _scan(data, ncolumns):
+    """
+    Return (starts, lengths) arrays of the fields in binary COPY data.
+
+    Both arrays have one row per tuple and one column per field. Lengths
+    of NULL fields are -1.
+
+    Tuples are located with NumPy instead of walking them one by one.
+    Each offset holding the field count is a candidate tuple start, and
+    the end of a tuple starting at each candidate is computed for all of
+    them at once, field by field. The tuples are then the chain of
+    candidates from the first tuple to the trailer, which is marked by
+    pointer doubling in a logarithmic number of vectorized steps.
+
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    start = _body_start(data)
+    end = len(data) - len(TRAILER)
+    if end < start or data[end:] != TRAILER:
+        raise ValueError("Invalid binary COPY trailer.")
+    if end == start:
+        empty = np.zeros((0, ncolumns), dtype=np.int64)
+        return (empty, empty)
+
+    (high, low) = bytearray(struct.pack('!h', ncolumns))
+    candidates = start + np.flatnonzero((buf[start:end - 1] == high) &
+                                        (buf[start + 1:end] == low))
+    if not len(candidates) or candidates[0] != start:
+        raise ValueError("Expected %s fields per tuple." % ncolumns)
+
+    # End of a tuple starting at each candidate, or -1 if impossible.
+    ends = candidates + 2
+    valid = np.ones(len(candidates), dtype=bool)
+    for i in range(ncolumns):
+        inside = ends + 4 <= end
+        lengths = _int32(buf, np.where(inside, ends, start))
+        valid &= inside & (lengths >= -1)
+        ends = ends + 4 + np.maximum(lengths, 0)
+    valid &= ends <= end
+
+    # Candidate that follows each candidate, or the trailer node, or the
+    # invalid node if none does.
+    (trailer, invalid) = (len(candidates), len(candidates) + 1)
+    following = np.searchsorted(candidates, ends)
+    found = valid & (following < len(candidates))
+    found[found] = candidates[following[found]] == ends[found]
+    following = np.where(found, following, invalid)
+    following[valid & (ends == end)] = trailer
+    following = np.concatenate([following, [trailer, invalid]])
+
+    # Mark the chain from the first tuple, doubling the number of steps
+    # followed in each round.
+    chain = np.zeros(len(following), dtype=bool)
+    chain[0] = True
+    steps = 1
+    while steps <= len(candidates):
+        chain[following[chain]] = True
+        following = following[following]
+        steps *= 2
+    if chain[invalid] or not chain[trailer]:
+        raise ValueError("Invalid binary COPY data.")
+    rows = candidates[chain[:len(candidates)]]
+
+    starts = np.empty((len(rows), ncolumns), dtype=np.int64)
+    lengths = np.empty((len(rows), ncolumns), dtype=np.int64)
+    position = rows + 2
+    for i in range(ncolumns):
+        lengths[:, i] = _int32(buf, position)
+        starts[:, i] = position + 4
+        position = starts[:, i] + np.maximum(lengths[:, i], 0)
+    return (starts, lengths)
+
+
+def _scan_fixed(data, widths):
+    """
+    Return (starts, lengths) arrays of binary COPY data in which every
+    field is non-null and fixed-width, or None otherwise.
+
+    Every tuple then has the same length, so the fields are located with
+    a single structured view of the data, without scanning.
+
+    """
+    if not widths or None in widths or data[-len(TRAILER):] != TRAILER:
+        return None
+    start = _body_start(data)
+    body = len(data) - start - len(TRAILER)
+    row_size = 2 + sum(4 + width for width in widths)
+    if body % row_size:
+        return None
+    descr = [('count', '>i2')]
+    for (i, width) in enumerate(widths):
+        descr += [('length%s' % i, '>i4'), ('value%s' % i, 'V%s' % width)]
+    nrows = body // row_size
+    rows = np.frombuffer(data, dtype=np.dtype(descr), count=nrows,
+                         offset=start)
+    if not (rows['count'] == len(widths)).all():
+        return None
+    for (i, width) in enumerate(widths):
+        if not (rows['length%s' % i] == width).all():
+            return None
+
+    # Offset of each value within a tuple.
+    value_offsets = (2 + np.cumsum([4 + width for width in widths]) -
+                     np.array(widths))
+    starts = (start + np.arange(nrows, dtype=np.int64)[:, np.newaxis] *
+              row_size + value_offsets)
+    lengths = np.tile(np.array(widths, dtype=np.int64), (nrows, 1))
+    return (starts, lengths)
+
+
+def to_arrow(data, names, type_names, encoding='utf-8'):
+    """
+    Decode binary COPY data into an Arrow table.
+
+    Values are gathered from the data into NumPy arrays column by column.
+    If every field is fixed-width and non-null, the tuples are located
+    with a single structured view; otherwise, they are located by _scan.
+
+    Requires pyarrow.
+
+    Parameters
+    ----------
+    data : bytes
+        Binary COPY data, including header and trailer.
+    names : list of str
+        Column names.
+    type_names : list of str
+        pg_type name of each column, which must be in FIXED_DTYPES,
+        TEXT_TYPES, or BINARY_TYPES.
+    encoding : str, optional
+        Python codec of character types, which must match the client
+        encoding of the connection that copied the data.
+
+    Returns
+    -------
+    table : pyarrow.Table
+
+    """
+    import pyarrow as pa
+
+    fields = _scan_fixed(data, [FIXED_DTYPES[type_name].itemsize
+                                if type_name in FIXED_DTYPES else None
+                                for type_name in type_names])
+    if fields is None:
+        fields = _scan(data, len(names))
+    (starts, lengths) = fields
+
+    buf = np.frombuffer(data, dtype=np.uint8)
+    columns = []
+    for (i, type_name) in enumerate(type_names):
+        mask = lengths[:, i] < 0
+        if type_name in FIXED_DTYPES:
+            dtype = FIXED_DTYPES[type_name]
+            column_starts = np.where(mask, 0, starts[:, i])
+            values = buf[column_starts[:, np.newaxis] +
+                         np.arange(dtype.itemsize)]
+            values = values.view(dtype).ravel()
+            columns.append(_fixed_array(values, mask, type_name))
+        elif type_name in TEXT_TYPES + BINARY_TYPES:
+            column_lengths = np.where(mask, 0, lengths[:, i])
+            values = buf[_ranges(starts[:, i], column_lengths)]
+            offsets = np.concatenate([[0], np.cumsum(column_lengths)])
+            if type_name in BINARY_TYPES:
+                arrow_type = pa.binary()
+            elif encoding.replace('-', '').lower() == 'utf8':
+                arrow_type = pa.string()
+            else:
+                # Decode other character encodings value by value.
+                arrow_type = pa.binary()
+            if offsets[-1] >= 2 ** 31:
+                arrow_type = (pa.large_binary() if arrow_type == pa.binary()
+                              else pa.large_string())
+                offsets = offsets.astype(np.int64)
+            else:
+                offsets = offsets.astype(np.int32)
+            array = pa.Array.from_buffers(
+                arrow_type, len(mask),
+                [_validity(mask), pa.py_buffer(offsets),
+                 pa.py_buffer(values)], null_count=int(mask.sum()))
+            if type_name in TEXT_TYPES and arrow_type == pa.binary():
+                array = pa.array([None if value is None
+                                  else value.decode(encoding)
+                                  for value in array.to_pylist()],
+                                 type=pa.string())
+            columns.append(array)
+        else:
+            raise ValueError("No binary decoder for type: %s" % type_name)
+    return pa.Table.from_arrays(columns, names=list(names))
+
+
+class ArrowCopyWriter(object):
+    """
+    Write-only file-like object decoding binary COPY data into Arrow.
+
+    Pass it to psycopg2's copy_expert to decode a COPY TO STDOUT stream
+    into record batches of batch_size rows as it is received, instead of
+    buffering all of it. PostgreSQL sends one message per tuple, which
+    psycopg2 writes separately, so batches are split between tuples.
+
+    Requires pyarrow.
+
+    Parameters
+    ----------
+    names : list of str
+        Column names.
+    type_names : list of str
+        pg_type name of each column, as for to_arrow.
+    encoding : str, optional
+        Python codec of character types, as for to_arrow.
+    batch_size : int, optional
+        Number of rows per record batch. Default is 65536.
+
+    Attributes
+    ----------
+    batches : list of pyarrow.RecordBatch
+        Record batches decoded so far.
+
+    """
+    def __init__(self, names, type_names, encoding='utf-8',
+                 batch_size=65536):
+        self._names = list(names)
+        self._type_names = list(type_names)
+        self._encoding = encoding
+        self._batch_size = batch_size
+        self._chunks = []
+        self._header = True
+        self._schema = None
+        self.batches = []
+
+    def write(self, data):
+        data = bytes(data)
+        if self._header:
+            # The header is sent together with the first tuple.
+            data = data[_body_start(data):]
+            self._header = False
+        if data and data != TRAILER:
+            self._chunks.append(data)
+            if len(self._chunks) >= self._batch_size:
+                self._flush()
+
+    def _flush(self):
+        data = b''.join([HEADER] + self._chunks + [TRAILER])
+        self._chunks = []
+        table = to_arrow(data, self._names, self._type_names,
+                         encoding=self._encoding)
+        self._schema = table.schema
+        self.batches.extend(table.to_batches())
+
+    def table(self):
+        """Return Arrow table of all rows written."""
+        import pyarrow as pa
+
+        if self._chunks or not self.batches:
+            self._flush()
+        return pa.Table.from_batches(self.batches, schema=self._schema)
+
+
+def _fixed_array(values, mask, type_name):
+    """Return Arrow array of decoded fixed-width values."""
+    import pyarrow as pa
+
+    if type_name == 'bool':
+        return pa.array(values != 0, mask=mask)
+    elif type_name == 'date':
+        values = values.astype(np.int32) + EPOCH_DAYS
+        arrow_type = pa.date32()
+    elif type_name in ('timestamp', 'timestamptz'):
+        values = values.astype(np.int64) + EPOCH_MICROSECONDS
+        arrow_type = pa.timestamp(
+            'us', tz='UTC' if type_name == 'timestamptz' else None)
+    else:
+        values = values.astype(values.dtype.newbyteorder('='))
+        arrow_type = pa.from_numpy_dtype(values.dtype)
+    return pa.Array.from_buffers(
+        arrow_type, len(values),
+        [_validity(mask), pa.py_buffer(np.ascontiguousarray(values))],
+        null_count=int(mask.sum()))
+
+
+def from_arrow(table, encoding='utf-8'):
+    """
+    Encode an Arrow table as binary COPY data.
+
+    Fields are written into a preallocated buffer column by column, with
+    NumPy scatters, instead of encoding tuples of Python values.
+    Integer, floating point, boolean, date, timestamp, string, and binary
+    columns are supported. Other types are cast to strings.
+
+    Requires pyarrow.
+
+    Parameters
+    ----------
+    table : pyarrow.Table
+    encoding : str, optional
+        Python codec used to encode strings, which must match the client
+        encoding of the connection.
+
+    Returns
+    -------
+    type_names : list of str
+        PostgreSQL type name of each column, for creating a table.
+    data : bytes
+        Binary COPY data, including header and trailer.
+
+    """
+    import pyarrow as pa
+
+    table = table.combine_chunks()
+    columns = []
+    for column in table.columns:
+        if column.num_chunks:
+            array = column.chunk(0)
+        else:
+            array = pa.array([], type=column.type)
+        columns.append(_encode_array(array, encoding))
+
+    nrows = table.num_rows
+    row_sizes = np.full(nrows, 2, dtype=np.int64)
+    for (type_name, lengths, values) in columns:
+        row_sizes += 4 + np.maximum(lengths, 0)
+    row_starts = len(HEADER) + np.cumsum(row_sizes) - row_sizes
+
+    out = np.zeros(len(HEADER) + int(row_sizes.sum()) + len(TRAILER),
+                   dtype=np.uint8)
+    out[:len(HEADER)] = np.frombuffer(HEADER, dtype=np.uint8)
+    out[len(out) - len(TRAILER):] = np.frombuffer(TRAILER, dtype=np.uint8)
+    _put(out, row_starts, np.full(nrows, len(columns), dtype='>i2'))
+    positions = row_starts + 2
+    for (type_name, lengths, values) in columns:
+        _put(out, positions, lengths.astype('>i4'))
+        positions = positions + 4
+        if isinstance(values, tuple):
+            # Variable-width values, as a data buffer and value starts.
+            (data, starts) = values
+            value_lengths = np.maximum(lengths, 0)
+            out[_ranges(positions, value_lengths)] = \
+                data[_ranges(starts, value_lengths)]
+        else:
+            notnull = lengths >= 0
+            _put(out, positions[notnull], values[notnull])
+        positions = positions + np.maximum(lengths, 0)
+
+    type_names = [type_name for (type_name, lengths, values) in columns]
+    return (type_names, out.tobytes())
+
+
+def _put(out, positions, values):
+    """Write fixed-width values into a byte array at positions."""
+    width = values.dtype.itemsize
+    values = np.ascontiguousarray(values).view(np.uint8).reshape(-1, width)
+    out[positions[:, np.newaxis] + np.arange(width)] = values
+
+
+def _encode_array(array, encoding):
+    """
+    Return (type name, lengths, values) of an Arrow array to encode.
+
+    Lengths are -1 for nulls. Values are a big-endian NumPy array for
+    fixed-width types, or a (data, starts) tuple for variable-width types.
+
+    """
+    import pyarrow as pa
+    types = pa.types
+
+    if types.is_dictionary(array.type):
+        array = array.dictionary_decode()
+    mask = array.is_null().to_numpy(zero_copy_only=False)
+    array_type = array.type
+
+    if types.is_boolean(array_type):
+        (type_name, dtype) = ('boolean', FIXED_DTYPES['bool'])
+        values = array.fill_null(False).to_numpy(zero_copy_only=False)
+    elif types.is_integer(array_type):
+        width = array_type.bit_width // 8
+        if types.is_unsigned_integer(array_type):
+            width *= 2
+        (type_name, dtype) = {
+            1: ('smallint', FIXED_DTYPES['int2']),
+            2: ('smallint', FIXED_DTYPES['int2']),
+            4: ('integer', FIXED_DTYPES['int4']),
+        }.get(width, ('bigint', FIXED_DTYPES['int8']))
+        values = array.fill_null(0).to_numpy()
+    elif types.is_floating(array_type):
+        if array_type.bit_width == 64:
+            (type_name, dtype) = ('double precision', FIXED_DTYPES['float8'])
+        else:
+            (type_name, dtype) = ('real', FIXED_DTYPES['float4'])
+        values = array.fill_null(0).to_numpy()
+    elif types.is_date(array_type):
+        (type_name, dtype) = ('date', FIXED_DTYPES['date'])
+        values = array.cast(pa.date32()).cast(pa.int32()).fill_null(0)
+        values = values.to_numpy() - EPOCH_DAYS
+    elif types.is_timestamp(array_type):
+        if array_type.tz:
+            (type_name, dtype) = ('timestamp with time zone',
+                                  FIXED_DTYPES['timestamptz'])
+        else:
+            (type_name, dtype) = ('timestamp', FIXED_DTYPES['timestamp'])
+        values = array.cast(pa.timestamp('us', array_type.tz), safe=False)
+        values = values.cast(pa.int64()).fill_null(0)
+        values = values.to_numpy() - EPOCH_MICROSECONDS
+    else:
+        if types.is_binary(array_type) or types.is_large_binary(array_type):
+            type_name = 'bytea'
+        else:
+            type_name = 'text'
+            if not (types.is_string(array_type) or
+                    types.is_large_string(array_type)):
+                try:
+                    array = array.cast(pa.string())
+                except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                    raise ValueError("No binary encoder for Arrow type: %s"
+                                     % array_type)
+            if encoding.replace('-', '').lower() != 'utf8':
+                # Encode other character encodings value by value.
+                array = pa.array([None if value is None
+                                  else value.encode(encoding)
+                                  for value in array.to_pylist()],
+                                 type=pa.binary())
+        large = (types.is_large_binary(array.type) or
+                 types.is_large_string(array.type))
+        (validity, offsets, data) = array.buffers()
+        offsets = np.frombuffer(offsets, dtype=np.int64 if large
+                                else np.int32)
+        offsets = offsets[array.offset:array.offset + len(array) + 1]
+        if data is None:
+            data = np.zeros(0, dtype=np.uint8)
+        else:
+            data = np.frombuffer(data, dtype=np.uint8)
+        lengths = np.where(mask, -1, np.diff(offsets)).astype(np.int64)
+        return (type_name, lengths, (data, offsets[:-1].astype(np.int64)))
+
+    lengths = np.where(mask, -1, dtype.itemsize).astype(np.int64)
+    return (type_name, lengths, values.astype(dtype))
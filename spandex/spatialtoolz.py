@@ -1,6 +1,7 @@
 import logging
 
 from geoalchemy2 import Geometry
+from six import string_types
 from sqlalchemy import func, or_
 from sqlalchemy.orm import aliased, class_mapper
 
@@ -16,34 +17,93 @@ logging.basicConfig()
 logger = logging.getLogger(__name__)
 
 
+# Default strategy for updating tables, used unless a strategy argument
+# is passed: 'update' to update rows in place, 'rewrite' to rewrite
+# tables with the new values by io.rewrite_table, which is faster when
+# most rows change and leaves compact tables without dead rows, or
+# 'parallel' to update chunks of rows on update_workers connections
+# by io.parallel_update.
+update_strategy = 'update'
+update_workers = 4
+
+
+def _update(table, values, where=None, join=None, strategy=None):
+    """
+    Set column values of table rows using the update strategy.
+
+    Parameters
+    ----------
+    table : sqlalchemy.ext.declarative.DeclarativeMeta
+        Table ORM class to update.
+    values : dict
+        Dictionary mapping column ORM objects to SQLAlchemy expressions
+        of their new values.
+    where : sqlalchemy.sql.expression.ClauseElement, optional
+        Condition of rows to update.
+    join : sqlalchemy.ext.declarative.DeclarativeMeta, optional
+        Other table that values and where refer to.
+    strategy : str, optional
+        'update', 'rewrite', or 'parallel'. Defaults to update_strategy.
+
+    Returns
+    -------
+    None
+
+    """
+    if strategy is None:
+        strategy = update_strategy
+    if strategy == 'update':
+        with db.session() as sess:
+            q = sess.query(table)
+            if where is not None:
+                q = q.filter(where)
+            q.update(values, synchronize_session=False)
+    elif strategy == 'rewrite':
+        io.rewrite_table(table, values, where=where, join=join)
+    elif strategy == 'parallel':
+        io.parallel_update(table, values, where=where,
+                           workers=update_workers)
+    else:
+        raise ValueError("Unknown update strategy: %s" % strategy)
+
+
 def tag(target_table, target_column_name, source_table, source_column_name,
-        how='point_in_poly', df=None):
+        how='point_in_poly', df=None, strategy=None):
     """
-    Tag target table with attribute of a spatially-related source table.
+    Tag target table with attributes of a spatially-related source table.
+
+    Multiple columns are tagged with a single spatial join and UPDATE
+    when lists or a mapping of column names are given.
 
     Parameters
     ----------
     target_table : sqlalchemy.ext.declarative.DeclarativeMeta
         Target table ORM class to be tagged.
-    target_column_name : str
+    target_column_name : str, list of str, or None
         Name of column in target table to add (if doesn't exist)
         or update (if exists). This where the tag value will be stored.
+        A list of names is paired with a list of source column names.
+        Must be None if source_column_name is a mapping.
     source_table : sqlalchemy.ext.declarative.DeclarativeMeta
         Source table ORM class containing information to tag target table.
-    source_column_name : str
-        Name of column in source table that contains the tagging information.
+    source_column_name : str, list of str, or dict
+        Name of column in source table that contains the tagging information,
+        a list of names, or a mapping of source to target column names.
     how : str, optional
         How to relate the two tables spatially.
         If not specified, defaults to 'point_in_poly'.
         Other spatial relationships are not currently supported.
     df : pandas.DataFrame, optional
         DataFrame to return a tagged copy of.
+    strategy : str, optional
+        Update strategy, 'update', 'rewrite', or 'parallel'.
+        Defaults to module-level update_strategy.
 
     Returns
     -------
     None
         However, if df argument is provided, pandas.DataFrame with the
-        new or updated column is returned.
+        new or updated columns is returned.
 
     """
     # Other spatial relationships are not supported.
@@ -54,31 +114,58 @@ def tag(target_table, target_column_name, source_table, source_column_name,
     # Table projections must be equal.
     assert srid_equality([target_table, source_table])
 
-    # Get source column ORM object.
-    source_column = getattr(source_table, source_column_name)
-
-    # Add target column to target table if it does not already exist.
-    if target_column_name in target_table.__table__.columns:
-        target_column = getattr(target_table, target_column_name)
+    # Pair source column names with target column names.
+    if hasattr(source_column_name, 'items'):
+        if target_column_name is not None:
+            raise ValueError("target_column_name must be None if "
+                             "source_column_name is a mapping.")
+        names = list(source_column_name.items())
+    elif isinstance(source_column_name, string_types):
+        if not isinstance(target_column_name, string_types):
+            raise ValueError("target_column_name must be a string if "
+                             "source_column_name is a string.")
+        names = [(source_column_name, target_column_name)]
     else:
-        # Use data type of source column for new column.
-        dtype = source_column.property.columns[0].type.compile()
-        target_column = io.add_column(target_table, target_column_name, dtype)
-
-    # Tag target table with column from source table.
-    with db.session() as sess:
-        sess.query(target_table).filter(
-            target_table.geom.ST_Centroid().ST_Within(source_table.geom)
-        ).update(
-            {target_column: source_column},
-            synchronize_session=False
-        )
-
-    if df:
-        return io.update_df(df, target_column, target_table)
-
-
-def proportion_overlap(target_table, over_table, column_name, df=None):
+        source_column_names = list(source_column_name)
+        if (not isinstance(target_column_name, (list, tuple)) or
+                len(target_column_name) != len(source_column_names)):
+            raise ValueError("target_column_name must be a list of the "
+                             "same length as source_column_name.")
+        names = list(zip(source_column_names, target_column_name))
+
+    # Get source column ORM objects.
+    source_columns = [getattr(source_table, source_name)
+                      for (source_name, target_name) in names]
+
+    # Add target columns to target table if they do not already exist,
+    # using data types of source columns for new columns.
+    new_columns = []
+    for (source_column, (source_name, target_name)) in \
+            zip(source_columns, names):
+        if target_name not in target_table.__table__.columns:
+            dtype = source_column.property.columns[0].type.compile()
+            new_columns.append((target_name, dtype))
+    if new_columns:
+        io.add_columns(target_table, new_columns)
+    target_columns = [getattr(target_table, target_name)
+                      for (source_name, target_name) in names]
+
+    # Tag target table with columns from source table.
+    _update(
+        target_table, dict(zip(target_columns, source_columns)),
+        where=target_table.geom.ST_Centroid().ST_Within(source_table.geom),
+        join=source_table, strategy=strategy
+    )
+
+    if df is not None:
+        for target_column in target_columns:
+            df = io.update_df(df, target_column, target_table,
+                              incremental=True)
+        return df
+
+
+def proportion_overlap(target_table, over_table, column_name, df=None,
+                       strategy=None):
     """
     Calculate proportion of target table geometry overlap.
 
@@ -98,6 +185,9 @@ def proportion_overlap(target_table, over_table, column_name, df=None):
         will be stored.
     df : pandas.DataFrame, optional
         DataFrame to return a copy of with proportion overlap calculation.
+    strategy : str, optional
+        Update strategy, 'update', 'rewrite', or 'parallel'.
+        Defaults to module-level update_strategy.
 
     Returns
     -------
@@ -116,7 +206,7 @@ def proportion_overlap(target_table, over_table, column_name, df=None):
         column = io.add_column(target_table, column_name, 'float')
 
     # Pre-calculate column area.
-    calc_area(target_table)
+    calc_area(target_table, strategy=strategy)
 
     # Calculate proportion of overlapping area for each target table row.
     with db.session() as sess:
@@ -129,16 +219,14 @@ def proportion_overlap(target_table, over_table, column_name, df=None):
         ).group_by(
             target_table.geom
         )
-        sess.query(target_table).update(
-            {column: proportion_overlap.selectable},
-            synchronize_session=False
-        )
+    _update(target_table, {column: proportion_overlap.as_scalar()},
+            strategy=strategy)
 
-    if df:
-        return io.update_df(df, column, target_table)
+    if df is not None:
+        return io.update_df(df, column, target_table, incremental=True)
 
 
-def trim(target_col, trim_col):
+def trim(target_col, trim_col, strategy=None):
     """
     Trim target geometry by removing intersection with a trim column.
 
@@ -148,6 +236,9 @@ def trim(target_col, trim_col):
         Column ORM object to trim.
     trim_col : sqlalchemy.orm.attributes.InstrumentedAttribute
         Column ORM object to trim target column with.
+    strategy : str, optional
+        Update strategy, 'update', 'rewrite', or 'parallel'.
+        Defaults to module-level update_strategy.
 
     Returns
     -------
@@ -157,9 +248,21 @@ def trim(target_col, trim_col):
     # TODO: Aggregate multiple rows in trim_col.
     # Needs testing to make sure that ST_Difference can handle MultiPolygons
     # without data loss.
+    data_type = target_col.property.columns[0].type
+    geom_type = data_type.geometry_type
+    strategy = strategy or update_strategy
+    if strategy in ('rewrite', 'parallel'):
+        # ST_Difference outputs Polygon, not MultiPolygon, so coerce the
+        # new values instead of changing the geometry data type.
+        difference = target_col.ST_Difference(trim_col)
+        if geom_type.lower() == "multipolygon":
+            difference = func.ST_Multi(difference)
+        _update(target_col.class_, {target_col: difference},
+                where=target_col.ST_Intersects(trim_col),
+                join=trim_col.class_, strategy=strategy)
+        return
+
     with db.session() as sess:
-        data_type = target_col.property.columns[0].type
-        geom_type = data_type.geometry_type
         if geom_type.lower() == "multipolygon":
             # ST_Difference outputs Polygon, not MultiPolygon.
             # Temporarily change the geometry data type to generic Geometry.
@@ -226,7 +329,7 @@ def srid_equality(tables):
         return False
 
 
-def calc_area(table):
+def calc_area(table, strategy=None):
     """
     Calculate area in units of projection and store value in calc_area column.
 
@@ -235,6 +338,9 @@ def calc_area(table):
     table : sqlalchemy.ext.declarative.DeclarativeMeta
         Table ORM class with geom column to calculate area for. Value is
         stored in the calc_area column, which is created if it does not exist.
+    strategy : str, optional
+        Update strategy, 'update', 'rewrite', or 'parallel'.
+        Defaults to module-level update_strategy.
 
     Returns
     -------
@@ -251,11 +357,7 @@ def calc_area(table):
 
     # Calculate geometric area.
     try:
-        with db.session() as sess:
-            sess.query(table).update(
-                {column: table.geom.ST_Area()},
-                synchronize_session=False
-            )
+        _update(table, {column: table.geom.ST_Area()}, strategy=strategy)
     except:
         # Remove column if it was freshly added and exception raised.
         if column_added:
@@ -263,7 +365,7 @@ def calc_area(table):
         raise
 
 
-def calc_dist(table, geom):
+def calc_dist(table, geom, strategy=None):
     """
     Calculate distance between a table of geometries and a geometry column.
 
@@ -281,6 +383,9 @@ def calc_dist(table, geom):
         ORM object to calculate distance to, like a column or query.
         Must contain only one column. Rows are aggregated into a MULTI object
         with ST_Collect (faster union that does not dissolve boundaries).
+    strategy : str, optional
+        Update strategy, 'update', 'rewrite', or 'parallel'.
+        Defaults to module-level update_strategy.
 
     Returns
     -------
@@ -305,11 +410,9 @@ def calc_dist(table, geom):
                     io.db_to_query(geom).label('geom')
                 )
             )
-            # Calculate distances from table geometries to MULTI object.
-            sess.query(table).update(
-                {column: table.geom.ST_Distance(multi)},
-                synchronize_session=False
-            )
+        # Calculate distances from table geometries to MULTI object.
+        _update(table, {column: table.geom.ST_Distance(multi.as_scalar())},
+                strategy=strategy)
         return column
     except:
         # Remove column if it was freshly added and exception raised.
@@ -561,7 +664,7 @@ def reproject(srid, table=None, column=None):
     db.refresh()
 
 
-def validate(table=None, column=None):
+def validate(table=None, column=None, strategy=None):
     """
     Attempt to fix invalid geometries.
 
@@ -574,6 +677,9 @@ def validate(table=None, column=None):
         Table ORM class containing geom column to validate.
     column : sqlalchemy.orm.attributes.InstrumentedAttribute, optional
         Column ORM object to validate.
+    strategy : str, optional
+        Update strategy, 'update', 'rewrite', or 'parallel'.
+        Defaults to module-level update_strategy.
 
     Returns
     -------
@@ -583,10 +689,9 @@ def validate(table=None, column=None):
     # Get Table and Column objects.
     if column:
         geom = column.property.columns[0]
-        t = geom.table
+        table = column.class_
     else:
-        t = table.__table__
-        geom = t.c.geom
+        geom = table.__table__.c.geom
 
     # Get column data and geometry type.
     data_type = geom.type
@@ -600,22 +705,18 @@ def validate(table=None, column=None):
     else:
         geom_type_num = None
 
-    with db.session() as sess:
-        # Fix geometries using ST_MakeValid. If geometry type is
-        # point/linestring/polygon, only extract elements of those types,
-        # to prevent invalid data type errors.
-        if geom_type_num:
-            valid_geom = func.ST_CollectionExtract(
-                func.ST_MakeValid(geom),
-                geom_type_num
-            )
-        else:
-            valid_geom = func.ST_MakeValid(geom)
-        sess.query(t).filter(
-            ~geom.ST_IsValid()
-        ).update(
-            {geom: valid_geom}, synchronize_session=False
+    # Fix geometries using ST_MakeValid. If geometry type is
+    # point/linestring/polygon, only extract elements of those types,
+    # to prevent invalid data type errors.
+    if geom_type_num:
+        valid_geom = func.ST_CollectionExtract(
+            func.ST_MakeValid(geom),
+            geom_type_num
         )
+    else:
+        valid_geom = func.ST_MakeValid(geom)
+    _update(table, {geom: valid_geom}, where=~geom.ST_IsValid(),
+            strategy=strategy)
 
 
 def conform_srids(srid, schema=None, fix=False):
@@ -1,10 +1,17 @@
+import json
+import struct
+
 import numpy as np
 import pandas as pd
 from pandas.util import testing as pdt
 import pytest
 
 from spandex import TableFrame
-from spandex.io import db_to_df, df_to_db
+from spandex.io import (add_columns, cluster_spatial, db_to_arrow, db_to_db,
+                        db_to_df, db_to_parquet, dbf_to_df, df_to_db,
+                        ensure_index, ensure_indexes, exec_sql, index_usage,
+                        parallel_update, update_df, update_from_df,
+                        vacuum_many)
 
 
 def test_tableframe(loader):
@@ -78,3 +85,464 @@ def test_sim_export(loader):
     parcels_out_df2 = db_to_df(parcels_out_table, index_col='parcel_id')
     pdt.assert_frame_equal(parcels_out_df1[column_names],
                            parcels_out_df2[column_names])
+
+
+def test_db_to_parquet(loader, tmpdir):
+    pq = pytest.importorskip('pyarrow.parquet')
+    path = str(tmpdir.join('hf_bg.parquet'))
+    bg = loader.tables.sample.hf_bg
+    rows = db_to_parquet(bg, path, row_group_size=10)
+    df = db_to_df(bg)
+    assert rows == len(df)
+
+    parquet_file = pq.ParquetFile(path)
+    assert parquet_file.metadata.num_rows == len(df)
+    assert parquet_file.metadata.num_row_groups == (len(df) + 9) // 10
+    geo = json.loads(parquet_file.schema_arrow.metadata[b'geo'])
+    assert geo['primary_column'] == 'geom'
+    assert geo['columns']['geom']['encoding'] == 'WKB'
+
+    table = parquet_file.read().to_pandas()
+    assert sorted(table.gid) == sorted(df.gid)
+    assert isinstance(table.geom[0], bytes)
+
+
+def test_db_to_db(loader):
+    bg = loader.tables.sample.hf_bg
+    db_to_db([bg.objectid, bg.geom], 'bg_ctas', loader.tables.sample,
+             pk='id', unlogged=True)
+    bg_ctas = loader.tables.sample.bg_ctas
+    df = db_to_df(bg_ctas, index_col='id')
+    assert sorted(df.index) == list(range(1, len(df) + 1))
+    with loader.database.cursor() as cur:
+        cur.execute("""
+            SELECT indexdef FROM pg_indexes
+            WHERE schemaname = 'sample' AND tablename = 'bg_ctas';
+        """)
+        indexdefs = [row[0] for row in cur]
+        cur.execute("""
+            INSERT INTO sample.bg_ctas (objectid) VALUES (0) RETURNING id;
+        """)
+        assert cur.fetchone()[0] == len(df) + 1
+    assert len(indexdefs) == 2
+    assert any('gist' in indexdef for indexdef in indexdefs)
+
+
+def test_ensure_index(loader):
+    bg = loader.tables.sample.hf_bg
+    # Existing GIST index created by shp2pgsql is reused.
+    [gist_index] = ensure_index(bg)
+    assert ensure_index(bg.geom) == [gist_index]
+
+    [btree_index] = ensure_indexes([(bg.objectid, 'btree')], workers=2)
+    assert ensure_index(bg.objectid, kind='btree') == [btree_index]
+
+    # Duplicate specs are built once.
+    assert ensure_indexes([bg.objectid, (bg.objectid, 'btree'), bg.geom],
+                          workers=2) == [btree_index, gist_index]
+
+    # Kind of non-geometry columns defaults to btree.
+    assert ensure_index(bg.objectid) == [btree_index]
+    [geoid_index] = ensure_index(bg.geoid)
+    assert geoid_index.endswith('_btree_idx')
+
+    usage = index_usage(bg)
+    indexes = usage.index.get_level_values('index')
+    assert gist_index in indexes and btree_index in indexes
+    assert 'used' in usage.columns
+
+
+def test_cluster_spatial(loader):
+    bg = loader.tables.sample.hf_bg
+    gids = sorted(db_to_df(bg).gid)
+    num_indexes = len(index_usage(bg))
+    for method in ['gist', 'geohash']:
+        cluster_spatial(bg, method=method)
+        assert sorted(db_to_df(bg).gid) == gids
+        # Temporary geohash index is dropped.
+        assert len(index_usage(bg)) == num_indexes
+    with pytest.raises(ValueError):
+        cluster_spatial(bg, method='unknown')
+
+    # Geohash falls back to GIST ordering without an SRID.
+    exec_sql("""
+        CREATE TABLE sample.bg_nosrid AS
+        SELECT gid, ST_SetSRID(geom, 0)::geometry(MultiPolygon) AS geom
+        FROM sample.hf_bg;
+    """)
+    cluster_spatial('sample.bg_nosrid', method='geohash')
+    with loader.database.cursor() as cur:
+        cur.execute("SELECT count(*) FROM sample.bg_nosrid;")
+        assert cur.fetchone()[0] == len(gids)
+
+    loader.load_shp('hf_bg.shp', 'sample.bg_clustered', cluster='gist')
+    assert len(db_to_df(loader.tables.sample.bg_clustered)) == len(gids)
+
+
+def test_vacuum_many(loader):
+    tables = [loader.tables.sample.hf_bg, 'sample.hf_water']
+    exec_sql("UPDATE sample.hf_bg SET objectid = objectid;")
+    df = vacuum_many(tables, workers=2)
+    assert list(df.columns) == ['seconds', 'dead_tuples', 'reclaimed']
+    assert set(df.index) == set(['sample.hf_bg', 'sample.hf_water'])
+    assert (df.seconds >= 0).all()
+    assert (df.reclaimed >= 0).all()
+    df = vacuum_many(tables, analyze_only=True)
+    assert len(df) == 2
+    assert (df.reclaimed == 0).all()
+
+
+def test_parallel_update(loader):
+    table = loader.tables.sample.hf_bg
+    df = db_to_df([table.gid, table.objectid], index_col='gid')
+    calls = []
+    done = set()
+    rows = parallel_update(table, {table.objectid: -table.objectid},
+                           workers=2, chunks=3, done=done,
+                           progress=lambda n, total: calls.append((n, total)))
+    assert rows == len(df)
+    assert calls[-1] == (3, 3)
+    assert len(done) == 3
+    df_db = db_to_df([table.gid, table.objectid], index_col='gid')
+    pdt.assert_series_equal(df_db.objectid.sort_index(),
+                            -df.objectid.sort_index())
+
+    # Finished chunks are skipped when resuming.
+    assert parallel_update(table, {table.objectid: 0}, workers=2, chunks=3,
+                           done=done) == 0
+
+
+def test_db_to_df_arrow(loader):
+    pytest.importorskip('pyarrow')
+    bg = loader.tables.sample.hf_bg
+    columns = [bg.gid, bg.objectid, bg.geoid]
+    df = db_to_df(columns, index_col='gid')
+    df_arrow = db_to_df(columns, index_col='gid', arrow=True)
+    pdt.assert_frame_equal(df_arrow.sort_index(), df.sort_index(),
+                           check_dtype=False)
+    assert isinstance(db_to_df(bg, arrow=True).geom[0], bytes)
+
+    # Streamed in several record batches.
+    table = db_to_arrow(columns, batch_size=5)
+    assert table.num_rows == len(df)
+    assert table.column('geoid').to_pylist() == \
+        db_to_arrow(columns).column('geoid').to_pylist()
+
+    df_to_db(df, 'bg_arrow', schema=loader.tables.sample, arrow=True)
+    df_db = db_to_df(loader.tables.sample.bg_arrow, index_col='gid')
+    pdt.assert_frame_equal(df_db[df.columns].sort_index(), df.sort_index(),
+                           check_dtype=False)
+
+
+def test_update_from_df(loader):
+    table = loader.tables.sample.hf_bg
+    df = db_to_df([table.gid, table.objectid], index_col='gid')
+    df['objectid'] = -df.objectid
+    assert update_from_df(df, table, 'gid') == len(df)
+    updated = db_to_df([table.gid, table.objectid], index_col='gid')
+    pdt.assert_series_equal(updated.objectid.sort_index(),
+                            df.objectid.sort_index())
+
+
+def test_update_df_incremental(loader):
+    table = loader.tables.sample.hf_bg
+    df = db_to_df([table.gid], index_col='gid')
+    df = update_df(df, table.objectid, table, incremental=True)
+    assert not df.objectid.isnull().any()
+    gid = df.index[0]
+    exec_sql("UPDATE sample.hf_bg SET objectid = -1 WHERE gid = %s;", (gid,))
+    df = update_df(df, table.objectid, table, incremental=True)
+    assert df.objectid[gid] == -1
+    assert (df.objectid.drop(gid) != -1).all()
+
+
+def test_add_columns(loader):
+    table = loader.tables.sample.hf_bg
+    columns = add_columns(table, [('a', 'integer'), ('b', 'text')],
+                          defaults={'a': 7})
+    assert [c.name for c in columns] == ['a', 'b']
+    df = db_to_df(columns)
+    assert (df.a == 7).all()
+    assert df.b.isnull().all()
+
+
+@pytest.mark.parametrize('tid_range_scans', [True, False])
+def test_duplicate(loader, monkeypatch, tid_range_scans):
+    # Copy in ctid ranges, or in one statement before PostgreSQL 14.
+    monkeypatch.setattr('spandex.io._tid_range_scans',
+                        lambda conn: tid_range_scans)
+    bg = loader.tables.sample.hf_bg
+    for workers in [1, 2]:
+        name = 'bg_dup{}'.format(workers)
+        dup = loader.duplicate(bg, name, schema_name='sample',
+                               workers=workers, unlogged=True)
+        assert sorted(db_to_df(dup).gid) == sorted(db_to_df(bg).gid)
+        with loader.database.cursor() as cur:
+            cur.execute("""
+                SELECT indexdef FROM pg_indexes
+                WHERE schemaname = 'sample' AND tablename = %s;
+            """, (name,))
+            indexdefs = [row[0] for row in cur]
+            cur.execute("""
+                SELECT relpersistence FROM pg_class
+                WHERE oid = %s::regclass;
+            """, ('sample.' + name,))
+            assert cur.fetchone()[0] == 'u'
+        assert len(indexdefs) == 2
+        assert any('gist' in indexdef for indexdef in indexdefs)
+
+
+def test_load_shp_map_workers(loader):
+    mapping = {'sample.bg_copy': 'hf_bg.shp',
+               'sample.water_copy': {'filename': 'hf_water.shp'}}
+    timings = loader.load_shp_map(mapping, workers=2)
+    assert set(timings.keys()) == set(mapping.keys())
+    assert len(TableFrame(loader.tables.sample.bg_copy)) == \
+        len(TableFrame(loader.tables.sample.hf_bg))
+    assert len(TableFrame(loader.tables.sample.water_copy)) == \
+        len(TableFrame(loader.tables.sample.hf_water))
+
+
+def test_load_shp_map_partitioned(loader):
+    mapping = {'a': 'hf_bg.shp', 'b': 'hf_bg.shp'}
+    for i in range(2):
+        # Reloading swaps the existing partitions.
+        timings = loader.load_shp_map(mapping, workers=2,
+                                      partition_table='sample.hf_all',
+                                      partition_key='layer')
+        assert set(timings.keys()) == set(mapping.keys())
+    hf_all = TableFrame(loader.tables.sample.hf_all)
+    counts = hf_all.layer.value_counts()
+    assert counts['a'] == counts['b'] == \
+        len(TableFrame(loader.tables.sample.hf_bg))
+
+    # Partitioned table has the primary key and spatial index.
+    with loader.database.cursor() as cur:
+        cur.execute("""
+            SELECT indexdef FROM pg_indexes
+            WHERE schemaname = 'sample' AND tablename = 'hf_all';
+        """)
+        indexes = [row[0] for row in cur]
+    assert any('(gid, layer)' in index for index in indexes)
+    assert any('gist' in index for index in indexes)
+
+    # Non-string key values are bound as text.
+    loader.load_shp_map({1: 'hf_bg.shp'}, partition_table='sample.hf_num')
+    assert set(TableFrame(loader.tables.sample.hf_num).source) == set(['1'])
+
+    # Key values that map to the same partition name are rejected.
+    with pytest.raises(ValueError):
+        loader.load_shp_map({'a b': 'hf_bg.shp', 'a_b': 'hf_bg.shp'},
+                            partition_table='sample.hf_all')
+
+
+def test_load_shp_map_partitioned_manifest(loader):
+    loader.manifest = 'sample.manifest'
+    mapping = {'a': 'hf_bg.shp'}
+    loader.load_shp_map(mapping, partition_table='sample.hf_all',
+                        partition_key='layer')
+    manifest = db_to_df(loader.tables.sample.manifest,
+                        index_col='table_name')
+    assert manifest.parent_table['sample.hf_all_a'] == 'sample.hf_all'
+    assert 'sample.hf_all_a_load' not in manifest.index
+
+    # Unchanged partitions are skipped on reload.
+    exec_sql("UPDATE sample.hf_all SET objectid = -1;")
+    loader.load_shp_map(mapping, partition_table='sample.hf_all',
+                        partition_key='layer')
+    assert (TableFrame(loader.tables.sample.hf_all).objectid == -1).all()
+
+    # Key values outside the partition bounds are rejected before attach.
+    with pytest.raises(ValueError):
+        loader.load_shp_map({'x': 'hf_bg.shp'},
+                            partition_table='sample.hf_geoid',
+                            partition_key='geoid')
+
+
+def test_get_attributes(loader):
+    df = loader.get_attributes('hf_bg.shp')
+    bg = TableFrame(loader.tables.sample.hf_bg, index_col='gid')
+    assert len(df) == len(bg)
+    assert (df.OBJECTID.values == bg.objectid.values).all()
+    assert df.GEOID.tolist() == bg.geoid.tolist()
+
+    df = loader.get_attributes('hf_bg.dbf', usecols=['GEOID', 'OBJECTID'])
+    assert list(df.columns) == ['OBJECTID', 'GEOID']
+    with pytest.raises(ValueError):
+        loader.get_attributes('hf_bg.shp', usecols=['missing'])
+
+
+def test_dbf_to_df_large_integers(tmpdir):
+    # Write a dBase file with integer fields of 18 and 20 digits.
+    path = str(tmpdir.join('ids.dbf'))
+    fields = [(b'ID', 18), (b'BIG', 20)]
+    records = [(b'123456789012345678', b'12345678901234567890'),
+               (b'               -42', b'                   7')]
+    record_length = 1 + sum(length for (name, length) in fields)
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<B3xIHH20x', 3, len(records),
+                            32 * (len(fields) + 1) + 1, record_length))
+        for (name, length) in fields:
+            f.write(struct.pack('<11sc4xBB14x', name, b'N', length, 0))
+        f.write(b'\r')
+        for record in records:
+            f.write(b' ' + b''.join(record))
+        f.write(b'\x1a')
+
+    df = dbf_to_df(path)
+    assert df.ID.dtype == np.int64
+    assert df.ID.tolist() == [123456789012345678, -42]
+    assert df.BIG.tolist() == [12345678901234567890, 7]
+
+
+def test_load_delimited(loader, tmpdir):
+    path = str(tmpdir.join('parcels.csv'))
+    with open(path, 'w') as f:
+        f.write("Parcel ID|FIPS|Land Value|Use Code\n"
+                "1|06013|1500.5|SFR\n"
+                "2|06013||\n")
+    rows = loader.load_delimited(path, 'sample.parcels_csv', delimiter='|')
+    assert rows == 2
+    df = db_to_df(loader.tables.sample.parcels_csv, index_col='parcel_id')
+    assert list(df.columns) == ['fips', 'land_value', 'use_code']
+    assert df.fips.tolist() == ['06013', '06013']
+    assert df.land_value[1] == 1500.5
+    assert df.use_code.isnull()[2]
+
+    timings = loader.load_delimited_map(
+        {'sample.parcels_a': {'filename': path, 'delimiter': '|'},
+         'sample.parcels_b': {'filename': path, 'delimiter': '|'}},
+        workers=2)
+    assert set(timings.keys()) == set(['sample.parcels_a', 'sample.parcels_b'])
+    assert len(db_to_df(loader.tables.sample.parcels_b)) == 2
+
+
+def test_load_shp_ogr(loader):
+    pytest.importorskip('osgeo.ogr')
+    loader.load_shp('hf_bg.shp', 'sample.bg_ogr', engine='ogr')
+    bg_ogr = TableFrame(loader.tables.sample.bg_ogr, index_col='gid')
+    bg = TableFrame(loader.tables.sample.hf_bg, index_col='gid')
+    assert len(bg_ogr) == len(bg)
+    pdt.assert_series_equal(bg_ogr.objectid, bg.objectid)
+
+
+def test_load_vector(loader, tmpdir):
+    gdal = pytest.importorskip('osgeo.gdal')
+    path = str(tmpdir.join('hf_bg.gpkg'))
+    gdal.VectorTranslate(path, loader.get_path('hf_bg.shp'),
+                         format='GPKG', layerName='bg')
+    srid = loader.get_srid('hf_bg.shp')
+    assert loader.get_vector_srid(path, layer='bg') == srid
+
+    rows = loader.load_vector(path, 'sample.bg_gpkg', layer='bg')
+    bg_gpkg = TableFrame(loader.tables.sample.bg_gpkg, index_col='gid')
+    bg = TableFrame(loader.tables.sample.hf_bg, index_col='gid')
+    assert rows == len(bg_gpkg) == len(bg)
+    assert sorted(bg_gpkg.objectid) == sorted(bg.objectid)
+
+
+def test_load_shp_defer_index(loader):
+    loader.load_shp('hf_bg.shp', 'sample.bg_deferred', defer_index=True,
+                    maintenance_work_mem='64MB')
+    with loader.database.cursor() as cur:
+        cur.execute("""
+            SELECT indexdef FROM pg_indexes
+            WHERE schemaname = 'sample' AND tablename = 'bg_deferred';
+        """)
+        indexdefs = [row[0] for row in cur]
+        cur.execute("""
+            SELECT count(*) FROM pg_stats
+            WHERE schemaname = 'sample' AND tablename = 'bg_deferred';
+        """)
+        num_stats = cur.fetchone()[0]
+    assert any('gist' in indexdef for indexdef in indexdefs)
+    assert num_stats > 0
+
+
+def test_load_shp_unlogged(loader):
+    def persistence():
+        with loader.database.cursor() as cur:
+            cur.execute("""
+                SELECT relpersistence FROM pg_class
+                WHERE oid = 'sample.bg_unlogged'::regclass;
+            """)
+            return cur.fetchone()[0]
+
+    loader.load_shp('hf_bg.shp', 'sample.bg_unlogged', unlogged=True)
+    assert persistence() == 'u'
+    loader.promote(loader.tables.sample.bg_unlogged)
+    assert persistence() == 'p'
+
+
+def test_load_shp_target_srid(loader):
+    pytest.importorskip('osgeo.osr')
+    loader.load_shp('hf_water.shp', 'sample.water_projected',
+                    target_srid=loader.srid)
+    geom = loader.tables.sample.water_projected.__table__.c.geom
+    assert geom.type.srid == loader.srid
+
+
+def test_get_srid_offline_cache(loader, tmpdir):
+    pytest.importorskip('osgeo.osr')
+    loader.offline = True
+    loader.srid_cache = str(tmpdir.join('srid_cache.json'))
+    srid = loader.get_srid('hf_bg.shp')
+    assert srid > 0
+    assert tmpdir.join('srid_cache.json').check()
+
+    # Fresh cache is read back from disk.
+    loader._srid_cache = None
+    assert loader.get_srid('hf_bg.shp') == srid
+
+
+def test_load_shp_manifest(loader):
+    loader.manifest = 'sample.manifest'
+    assert loader.load_shp('hf_bg.shp', 'sample.bg_tracked')
+    assert not loader.load_shp('hf_bg.shp', 'sample.bg_tracked', drop=True)
+    assert loader.load_shp('hf_bg.shp', 'sample.bg_tracked', drop=True,
+                           force=True)
+    manifest = db_to_df(loader.tables.sample.manifest,
+                        index_col='table_name')
+    assert manifest.row_count['sample.bg_tracked'] == \
+        len(TableFrame(loader.tables.sample.bg_tracked))
+
+
+def test_load_shp_chunked(loader):
+    pytest.importorskip('osgeo.ogr')
+    loader.checkpoint = 'sample.checkpoint'
+    loader.load_shp('hf_bg.shp', 'sample.bg_chunked', engine='ogr',
+                    chunk_size=5)
+    assert len(TableFrame(loader.tables.sample.bg_chunked)) == \
+        len(TableFrame(loader.tables.sample.hf_bg))
+    assert len(TableFrame(loader.tables.sample.checkpoint)) == 0
+
+
+def test_load_shp_chunked_resume(loader, monkeypatch):
+    pytest.importorskip('osgeo.ogr')
+    loader.checkpoint = 'sample.checkpoint'
+
+    # Interrupt loading after the first chunk is committed.
+    set_checkpoint = type(loader)._set_checkpoint
+
+    def interrupt(self, cur, table, fingerprint, offset):
+        if offset > 5:
+            raise KeyboardInterrupt
+        set_checkpoint(self, cur, table, fingerprint, offset)
+
+    monkeypatch.setattr(type(loader), '_set_checkpoint', interrupt)
+    with pytest.raises(KeyboardInterrupt):
+        loader.load_shp('hf_bg.shp', 'sample.bg_resumed', engine='ogr',
+                        chunk_size=5)
+    loader.database.refresh()
+    assert len(TableFrame(loader.tables.sample.bg_resumed)) == 5
+    monkeypatch.undo()
+
+    # Resume loading from the checkpoint.
+    loader.load_shp('hf_bg.shp', 'sample.bg_resumed', engine='ogr',
+                    chunk_size=5)
+    resumed = db_to_df(loader.tables.sample.bg_resumed)
+    source = db_to_df(loader.tables.sample.hf_bg)
+    assert len(resumed) == len(source)
+    assert not resumed.objectid.duplicated().any()
+    assert sorted(resumed.objectid) == sorted(source.objectid)
+    assert len(TableFrame(loader.tables.sample.checkpoint)) == 0
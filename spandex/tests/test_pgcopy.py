@@ -0,0 +1,111 @@
+import datetime
+import struct
+
+import pytest
+
+from spandex import pgcopy
+
+
+def read_all(copy_file, size=7):
+    data = b''
+    while True:
+        chunk = copy_file.read(size)
+        if not chunk:
+            return data
+        data += chunk
+
+
+def test_binary_copy_file():
+    encoders = [pgcopy.get_encoder('integer'),
+                pgcopy.get_encoder('varchar(10)'),
+                pgcopy.get_encoder('date')]
+    rows = [(1, u'a', datetime.date(2000, 1, 2)), (None, None, None)]
+    copy_file = pgcopy.BinaryCopyFile(rows, encoders)
+    data = read_all(copy_file)
+    assert copy_file.rowcount == 2
+    assert data.startswith(pgcopy.HEADER)
+    assert data.endswith(pgcopy.TRAILER)
+    body = data[len(pgcopy.HEADER):-len(pgcopy.TRAILER)]
+    assert body == (
+        struct.pack('!hii', 3, 4, 1) + struct.pack('!i', 1) + b'a' +
+        struct.pack('!ii', 4, 1) +
+        struct.pack('!hiii', 3, -1, -1, -1))
+
+
+def test_ewkb():
+    wkb = b'\x01\x01\x00\x00\x00' + struct.pack('<dd', 1, 2)
+    ewkb = pgcopy.ewkb(wkb, 2768)
+    assert ewkb[:9] == b'\x01\x01\x00\x00\x20' + struct.pack('<I', 2768)
+    assert ewkb[9:] == wkb[5:]
+
+
+def test_arrow_round_trip():
+    pa = pytest.importorskip('pyarrow')
+    table = pa.table({
+        'i': pa.array([1, None, 3], type=pa.int32()),
+        'f': pa.array([1.5, 2.5, None]),
+        's': pa.array([u'a', None, u'\xe9']),
+        'd': pa.array([datetime.date(2000, 1, 2), None,
+                       datetime.date(1999, 12, 31)]),
+    })
+    (type_names, data) = pgcopy.from_arrow(table)
+    assert type_names == ['integer', 'double precision', 'text', 'date']
+
+    # Identical to encoding rows of Python values.
+    encoders = [pgcopy.get_encoder(type_name) for type_name in type_names]
+    rows = zip(*[column.to_pylist() for column in table.columns])
+    assert data == pgcopy.BinaryCopyFile(rows, encoders).read()
+
+    decoded = pgcopy.to_arrow(data, table.column_names,
+                              ['int4', 'float8', 'text', 'date'])
+    assert decoded.equals(table)
+
+
+def test_arrow_fixed_width():
+    pa = pytest.importorskip('pyarrow')
+    table = pa.table({'a': pa.array(range(5), type=pa.int64()),
+                      'b': pa.array([0.5 * i for i in range(5)])})
+    (type_names, data) = pgcopy.from_arrow(table)
+    assert pgcopy._scan_fixed(data, [8, 8]) is not None
+    assert pgcopy.to_arrow(data, ['a', 'b'], ['int8', 'float8']).equals(table)
+
+
+def test_arrow_variable_width():
+    pa = pytest.importorskip('pyarrow')
+    # Values look like field counts and lengths, to check that tuples
+    # are located by following them from the first tuple.
+    table = pa.table({
+        'i': pa.array([2, None, 0, 3, None], type=pa.int64()),
+        's': pa.array([u'\x00\x02', None, u'', u'\x00\x00\x00\x02ab',
+                       u'\xe9']),
+        'b': pa.array([b'\x00\x03', b'', None, b'\xff\xff', b'x']),
+    })
+    (type_names, data) = pgcopy.from_arrow(table)
+    assert pgcopy._scan_fixed(data, [8, None, None]) is None
+    (starts, lengths) = pgcopy._scan(data, 3)
+    assert lengths.tolist() == [[8, 2, 2], [-1, -1, 0], [8, 0, -1],
+                                [8, 6, 2], [-1, 2, 1]]
+    assert pgcopy.to_arrow(data, table.column_names,
+                           ['int8', 'text', 'bytea']).equals(table)
+
+
+def test_arrow_copy_writer():
+    pa = pytest.importorskip('pyarrow')
+    table = pa.table({'i': pa.array([1, None, 3, 4, 5], type=pa.int32()),
+                      's': pa.array([u'a', u'bc', None, u'', u'd'])})
+    encoders = [pgcopy.get_encoder('integer'), pgcopy.get_encoder('text')]
+    rows = list(zip(*[column.to_pylist() for column in table.columns]))
+
+    # Header is sent with the first tuple, then one message per tuple.
+    writer = pgcopy.ArrowCopyWriter(['i', 's'], ['int4', 'text'],
+                                    batch_size=2)
+    writer.write(pgcopy.HEADER + pgcopy.encode_row(rows[0], encoders))
+    for row in rows[1:]:
+        writer.write(pgcopy.encode_row(row, encoders))
+    writer.write(pgcopy.TRAILER)
+    assert writer.table().equals(table)
+    assert len(writer.batches) == 3
+
+    empty = pgcopy.ArrowCopyWriter(['i'], ['int4'])
+    empty.write(pgcopy.HEADER + pgcopy.TRAILER)
+    assert empty.table().num_rows == 0
@@ -1,4 +1,5 @@
 import numpy as np
+import pytest
 from sqlalchemy import func
 
 from spandex import spatialtoolz
@@ -60,6 +61,65 @@ def test_tag(loader):
     assert np.all([bg_id in bg_df.index for bg_id in parcels_bg_ids])
 
 
+def test_tag_multiple(loader):
+    # Tag parcels with block group ID and GEOID in one spatial join.
+    parcels = loader.tables.sample.heather_farms
+    bg = loader.tables.sample.hf_bg
+    spatialtoolz.tag(parcels, None, bg,
+                     {'objectid': 'bg_id', 'geoid': 'bg_geoid'})
+    assert hasattr(parcels, 'bg_id')
+    assert hasattr(parcels, 'bg_geoid')
+
+    # Assert that tags agree with the block groups they were taken from.
+    parcels_df = db_to_df(parcels, index_col='parcel_id')
+    bg_df = db_to_df(bg, index_col='objectid')
+    assert not parcels_df.bg_geoid.isnull().any()
+    assert (parcels_df.bg_geoid ==
+            bg_df.geoid.loc[parcels_df.bg_id].values).all()
+
+    # Assert that mismatched column names are rejected.
+    for target in [['bg_id'], 'bg_id', None]:
+        with pytest.raises(ValueError):
+            spatialtoolz.tag(parcels, target, bg, ['objectid', 'geoid'])
+    with pytest.raises(ValueError):
+        spatialtoolz.tag(parcels, ['bg_id'], bg, 'objectid')
+    with pytest.raises(ValueError):
+        spatialtoolz.tag(parcels, 'bg_id', bg, {'objectid': 'bg_id'})
+
+    # Assert that list form tags the same values.
+    spatialtoolz.tag(parcels, ['bg_id2', 'bg_geoid2'], bg,
+                     ['objectid', 'geoid'])
+    parcels_df = db_to_df(parcels, index_col='parcel_id')
+    assert (parcels_df.bg_id2 == parcels_df.bg_id).all()
+    assert (parcels_df.bg_geoid2 == parcels_df.bg_geoid).all()
+
+
+def test_tag_rewrite(loader):
+    def count_indexes():
+        with loader.database.cursor() as cur:
+            cur.execute("""
+                SELECT count(*) FROM pg_indexes
+                WHERE schemaname = 'sample' AND tablename = 'heather_farms';
+            """)
+            return cur.fetchone()[0]
+
+    # Tag parcels with block group ID by rewriting the parcels table.
+    parcels = loader.tables.sample.heather_farms
+    bg = loader.tables.sample.hf_bg
+    num_indexes = count_indexes()
+    num_parcels = len(db_to_df(parcels))
+    spatialtoolz.tag(parcels, 'bg_id', bg, 'objectid', strategy='rewrite')
+
+    # Assert that rows and indexes survived the rewrite.
+    parcels = loader.tables.sample.heather_farms
+    parcels_df = db_to_df(parcels, index_col='parcel_id')
+    assert len(parcels_df) == num_parcels
+    assert count_indexes() == num_indexes
+
+    # Assert that all parcels have block groups.
+    assert not parcels_df.bg_id.isnull().any()
+
+
 def test_proportion_overlap(loader):
     # Calculate proportion of each parcel overlapped by water.
     parcels = loader.tables.sample.heather_farms
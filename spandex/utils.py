@@ -1,5 +1,6 @@
 import logging
 import os
+from multiprocessing.pool import ThreadPool
 
 from six.moves import configparser
 
@@ -52,3 +53,23 @@ def logf(level, f):
             else:
                 # Otherwise, stderr message may be important.
                 logger.log(level, line)
+
+
+def parallel_map(func, iterable, workers=1):
+    """Apply func to each item using a pool of worker threads.
+
+    Results are returned as a list in the order of the input. If workers
+    is 1 or less, items are processed sequentially in the calling thread.
+    Exceptions raised by func are re-raised in the calling thread.
+
+    """
+    items = list(iterable)
+    if workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    pool = ThreadPool(min(workers, len(items)))
+    try:
+        return pool.map(func, items, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()